@@ -0,0 +1,98 @@
+from collections import deque
+import threading
+import math
+import time
+
+#Raised when a request is not admitted, with the HTTP status and the seconds after which to retry
+class Rejected(Exception):
+    def __init__(self, status, message, retryAfter=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+        self.retryAfter = retryAfter
+
+#Admission control in front of the models: at most 'maxActive' requests run at once and
+#at most 'maxQueued' wait for them, in arrival order; the others are rejected right away.
+#A client (keyed by its address) may have at most 'perClient' requests running or waiting,
+#and a waiting request is dropped when its deadline passes before it can run.
+class Admission:
+    def __init__(self, maxActive, maxQueued, perClient):
+        self.maxActive = max(1, maxActive)
+        self.maxQueued = maxQueued
+        self.perClient = perClient
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = deque()
+        self.clients = {}
+        #moving average of the seconds a request runs, to tell clients when to retry
+        self.serviceSeconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+    #Seconds until a request arriving now would probably run
+    def retryAfter(self):
+        return max(1, math.ceil((len(self.waiting) + 1) * self.serviceSeconds / self.maxActive))
+
+    def reject(self, status, message):
+        self.rejected += 1
+        return Rejected(status, message, self.retryAfter())
+
+    #Waits for a slot and returns the time the request started running.
+    #Raises Rejected when the queue or the client's share is full, or the deadline passed.
+    def acquire(self, client, deadline=None):
+        with self.condition:
+            if self.clients.get(client, 0) >= self.perClient:
+                raise self.reject(429, "Too many concurrent requests from " + str(client))
+            if self.active >= self.maxActive and len(self.waiting) >= self.maxQueued:
+                raise self.reject(429, "Too many requests waiting")
+
+            self.clients[client] = self.clients.get(client, 0) + 1
+            ticket = object()
+            self.waiting.append(ticket)
+            try:
+                while self.waiting[0] is not ticket or self.active >= self.maxActive:
+                    timeout = None if deadline is None else deadline - time.time()
+                    if timeout is not None and timeout <= 0:
+                        self.expired += 1
+                        raise Rejected(504, "The deadline passed before the request could run")
+                    self.condition.wait(timeout)
+            except BaseException:
+                self.waiting.remove(ticket)
+                self.leave(client)
+                self.condition.notify_all()
+                raise
+            self.waiting.popleft()
+            self.active += 1
+            self.admitted += 1
+            #the next request in line may run too when slots are free
+            self.condition.notify_all()
+            return time.monotonic()
+
+    def leave(self, client):
+        self.clients[client] -= 1
+        if not self.clients[client]:
+            del self.clients[client]
+
+    #Frees the slot of a request that started running at 'started'
+    def release(self, client, started):
+        with self.condition:
+            self.active -= 1
+            self.leave(client)
+            self.serviceSeconds = 0.9 * self.serviceSeconds + 0.1 * (time.monotonic() - started)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'active': self.active,
+                'waiting': len(self.waiting),
+                'clients': len(self.clients),
+                'maxActive': self.maxActive,
+                'maxQueued': self.maxQueued,
+                'perClient': self.perClient,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'serviceSeconds': self.serviceSeconds
+            }
@@ -0,0 +1,323 @@
+from collections import OrderedDict
+from functools import lru_cache
+from math import gcd
+import numpy as np
+import subprocess
+import threading
+import queue
+import io
+import os
+
+#libsndfile encodes the output formats in-process when it is installed, ffmpeg otherwise
+try:
+    import soundfile
+except (ImportError, OSError):
+    soundfile = None
+
+try:
+    from scipy.signal import resample_poly
+except ImportError:
+    resample_poly = None
+
+#Rate the reference audio is decoded at, librosa's default one
+referenceRate = 22050
+
+#Mime types of the supported output formats
+mimeTypes = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg; codecs=opus",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/L16"
+}
+
+#File extensions of the output formats
+extensions = {"mp3": "mp3", "opus": "ogg", "flac": "flac", "wav": "wav", "pcm": "pcm"}
+
+#Output formats accepted as mime types, in the Accept header of the requests
+acceptedTypes = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/l16": "pcm",
+    "audio/pcm": "pcm"
+}
+
+#Sample rates Opus and MPEG audio encode, the other ones are resampled to the next one
+opusRates = (8000, 12000, 16000, 24000, 48000)
+mp3Rates = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+codecRates = {"mp3": mp3Rates, "opus": opusRates}
+
+#libsndfile (format, subtype) and ffmpeg output arguments of the formats.
+#Raw pcm is 16 bit big endian, the byte order of audio/L16.
+encoders = {
+    "mp3": (("MP3", "MPEG_LAYER_III"), ['-f', 'mp3']),
+    "opus": (("OGG", "OPUS"), ['-c:a', 'libopus', '-f', 'ogg']),
+    "flac": (("FLAC", "PCM_16"), ['-f', 'flac']),
+    "wav": (("WAV", "PCM_16"), ['-f', 'wav']),
+    "pcm": (None, ['-f', 's16be'])
+}
+
+#Bitrates (kbps) of the lowest and the highest libsndfile compression levels, by format
+compressionBitrates = {"mp3": (320, 32), "opus": (256, 6)}
+
+#Raised when ffmpeg cannot decode or encode the given audio
+class AudioError(Exception):
+    pass
+
+#Keeps a few ffmpeg processes started ahead for the 'commands' most recently used command lines,
+#so a request takes one that is already running instead of waiting for a new one to start.
+#The spares of the least recently used command line are killed when another one is used.
+class FfmpegPool:
+    def __init__(self, spares=2, commands=4):
+        self.spares = spares
+        self.commands = commands
+        self.processes = OrderedDict()
+        #command lines with a refill running
+        self.refilling = set()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def spawn(self, args):
+        return subprocess.Popen(['ffmpeg', '-hide_banner', '-loglevel', 'error'] + args,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    #Starts spare processes until there are 'spares' of them for 'args', or its command line is evicted
+    def refill(self, args):
+        key = tuple(args)
+        try:
+            while True:
+                with self.lock:
+                    spares = self.processes.get(key)
+                    if spares is None or len(spares) >= self.spares:
+                        return
+                process = self.spawn(args)
+                with self.lock:
+                    if self.processes.get(key) is spares:
+                        spares.append(process)
+                        continue
+                #evicted meanwhile
+                process.kill()
+                process.wait()
+                return
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
+
+    #A started process running 'args', its replacement is started in the background
+    def take(self, args):
+        if self.spares <= 0 or self.commands <= 0:
+            return self.spawn(args)
+        key = tuple(args)
+        evicted = []
+        with self.lock:
+            #the spares of the parent of a forked process belong to the parent
+            if self.pid != os.getpid():
+                self.processes = OrderedDict()
+                self.refilling = set()
+                self.pid = os.getpid()
+            spares = self.processes.setdefault(key, [])
+            self.processes.move_to_end(key)
+            process = spares.pop() if spares else None
+            while len(self.processes) > self.commands:
+                evicted += self.processes.popitem(last=False)[1]
+            refill = key not in self.refilling
+            self.refilling.add(key)
+        for spare in evicted:
+            spare.kill()
+            spare.wait()
+        if refill:
+            threading.Thread(target=self.refill, args=(args,), daemon=True).start()
+        return process if process is not None else self.spawn(args)
+
+    def stats(self):
+        with self.lock:
+            return {'commands': len(self.processes), 'spares': sum(len(p) for p in self.processes.values())}
+
+ffmpegPool = FfmpegPool()
+
+#Runs ffmpeg reading 'data' from stdin and returns its stdout
+def ffmpeg(args, data):
+    process = ffmpegPool.take(args)
+    stdout, stderr = process.communicate(data)
+    if process.returncode != 0:
+        raise AudioError(stderr.decode(errors="replace").strip())
+    return stdout
+
+#Decodes the bytes of an audio file (mp3, wav, ...) into a mono float32 array at 'sampleRate',
+#resampled in the same pass with ffmpeg's 'resampler' ("" for its default one, or "soxr")
+def decodeAudio(data, sampleRate=referenceRate, resampler=""):
+    filters = ['-af', 'aresample=resampler=' + resampler] if resampler else []
+    pcm = ffmpeg(['-i', 'pipe:0'] + filters + ['-f', 'f32le', '-ac', '1', '-ar', str(sampleRate), 'pipe:1'], data)
+    if not pcm:
+        raise AudioError("The audio file contains no samples")
+    return np.frombuffer(pcm, dtype=np.float32).copy()
+
+#Output format of the synthesized audio: the codec, the sample rate (None for the rate of the
+#synthesizer) and the bitrate in kbps of mp3 and opus (None for the encoder's default)
+class OutputFormat:
+    def __init__(self, codec="mp3", sampleRate=None, bitrate=None):
+        if codec not in mimeTypes:
+            raise ValueError("Unknown format " + codec + ", expected one of " + ", ".join(mimeTypes))
+        self.codec = codec
+        self.sampleRate = sampleRate
+        self.bitrate = bitrate if codec in compressionBitrates else None
+
+    #The format of 'format', an OutputFormat or a codec name
+    @staticmethod
+    def of(format):
+        return format if isinstance(format, OutputFormat) else OutputFormat(format)
+
+    #Rate the audio synthesized at 'sampleRate' is encoded at
+    def rate(self, sampleRate):
+        rate = self.sampleRate or sampleRate
+        rates = codecRates.get(self.codec)
+        if rates is not None and rate not in rates:
+            rate = min([r for r in rates if r >= rate] or [rates[-1]])
+        return rate
+
+    def mimeType(self, sampleRate):
+        if self.codec == "pcm":
+            return "audio/L16; rate=%d; channels=1" % self.rate(sampleRate)
+        return mimeTypes[self.codec]
+
+    @property
+    def extension(self):
+        return extensions[self.codec]
+
+    #Identifies the format in the keys of the result cache
+    def key(self):
+        if self.sampleRate is None and self.bitrate is None:
+            return self.codec
+        return "%s@%s/%s" % (self.codec, self.sampleRate or "", self.bitrate or "")
+
+    def __repr__(self):
+        return self.key()
+
+#Whether libsndfile can encode 'codec' in-process
+@lru_cache(maxsize=None)
+def encodesInProcess(codec):
+    if codec == "pcm":
+        return True
+    if soundfile is None:
+        return False
+    format, subtype = encoders[codec][0]
+    return subtype in soundfile.available_subtypes(format)
+
+#Resamples 'wav' from 'sampleRate' to 'rate' in-process, None when scipy is not installed
+def resample(wav, sampleRate, rate):
+    if rate == sampleRate:
+        return wav
+    if resample_poly is None:
+        return None
+    divisor = gcd(sampleRate, rate)
+    return resample_poly(wav, rate // divisor, sampleRate // divisor).astype(np.float32)
+
+#libsndfile compression level (0 best quality, 1 smallest) giving about 'bitrate' kbps
+def compressionLevel(codec, bitrate):
+    highest, lowest = compressionBitrates[codec]
+    return min(1.0, max(0.0, (highest - bitrate) / (highest - lowest)))
+
+#Encodes with libsndfile, or returns None when the format or the rate needs ffmpeg
+def encodeInProcess(wav, sampleRate, format):
+    if not encodesInProcess(format.codec):
+        return None
+    rate = format.rate(sampleRate)
+    wav = resample(np.asarray(wav, dtype=np.float32), sampleRate, rate)
+    if wav is None:
+        return None
+    if format.codec == "pcm":
+        return (np.clip(wav, -1.0, 1.0) * 32767).astype('>i2').tobytes()
+
+    (container, subtype), args = encoders[format.codec]
+    options = {}
+    if format.bitrate is not None:
+        options = {'compression_level': compressionLevel(format.codec, format.bitrate), 'bitrate_mode': "CONSTANT"}
+    output = io.BytesIO()
+    try:
+        with soundfile.SoundFile(output, "w", rate, 1, subtype, format=container, **options) as f:
+            f.write(wav)
+    except RuntimeError as e:
+        #LibsndfileError is a RuntimeError
+        raise AudioError("libsndfile failed to encode %s: %s" % (format, e))
+    return output.getvalue()
+
+#ffmpeg arguments encoding float samples at 'sampleRate' from stdin as 'format' to stdout
+def encoderArgs(sampleRate, format):
+    args = ['-f', 'f32le', '-ac', '1', '-ar', str(sampleRate), '-i', 'pipe:0', '-ar', str(format.rate(sampleRate))]
+    if format.bitrate is not None:
+        args += ['-b:a', "%dk" % format.bitrate]
+    return args + encoders[format.codec][1] + ['pipe:1']
+
+#Encodes a float array sampled at 'sampleRate' into the bytes of an audio file of 'format'
+#(an OutputFormat or a codec name), in-process when libsndfile can, with ffmpeg otherwise
+def encodeAudio(wav, sampleRate, format="mp3"):
+    format = OutputFormat.of(format)
+    data = encodeInProcess(wav, sampleRate, format)
+    if data is not None:
+        return data
+    pcm = np.ascontiguousarray(wav, dtype='<f4').tobytes()
+    return ffmpeg(encoderArgs(sampleRate, format), pcm)
+
+#Encodes audio incrementally with one ffmpeg process, so the encoded bytes of the
+#first samples are available before the last ones are generated
+class StreamEncoder:
+    def __init__(self, sampleRate, format="mp3"):
+        self.process = ffmpegPool.take(encoderArgs(sampleRate, OutputFormat.of(format)))
+        self.output = queue.Queue()
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    #Collects the encoded bytes as ffmpeg writes them
+    def read(self):
+        while True:
+            data = self.process.stdout.read1(65536)
+            if not data:
+                break
+            self.output.put(data)
+        self.output.put(None)
+
+    #Returns the bytes encoded so far without waiting
+    def available(self):
+        data = b""
+        while True:
+            try:
+                chunk = self.output.get_nowait()
+            except queue.Empty:
+                return data
+            if chunk is None:
+                #keep the end marker for finish()
+                self.output.put(None)
+                return data
+            data += chunk
+
+    #Feeds samples and returns the bytes encoded so far
+    def write(self, wav):
+        self.process.stdin.write(np.ascontiguousarray(wav, dtype='<f4').tobytes())
+        self.process.stdin.flush()
+        return self.available()
+
+    #Flushes the encoder and returns the remaining bytes
+    def finish(self):
+        self.process.stdin.close()
+        data = b""
+        while True:
+            chunk = self.output.get()
+            if chunk is None:
+                break
+            data += chunk
+        if self.process.wait() != 0:
+            raise AudioError("ffmpeg failed while encoding the stream")
+        return data
+
+    #Stops the encoder when the client went away before the end of the stream
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,229 @@
+from batcher import Batcher
+from pipeline import Pipeline, Stage
+from concurrent import futures
+import serviceConfig
+import importlib
+import threading
+import time
+import sys
+import gc
+
+#Modules and classes of the available backends, imported only when enabled
+available = {
+    'flowtron': ('flowtronBackend', 'FlowtronBackend'),
+    'sv2tts': ('sv2ttsBackend', 'SV2TTSBackend'),
+    'stub': ('stubBackend', 'StubBackend')
+}
+
+#Enabled backends by name
+registry = {}
+
+#Base of the synthesis backends, turning texts and speaker embeds into waveforms.
+#Every backend batches its own requests and can be unloaded when idle. The batches go
+#through the stages of the backend, pipelined so consecutive batches run in different stages.
+class Backend:
+    name = None
+
+    def __init__(self, device):
+        self.device = device
+        self.readiness = None
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.lastUsed = time.time()
+        #"loaded", "loading", "unloaded" or "failed" once the backend was first loaded at startup
+        self.state = None
+        self.batcher = Batcher(self.processBatch, serviceConfig.batchMaxSize, serviceConfig.batchMaxWaitMs,
+                               key=lambda request: self.batchKey(*request))
+        self.pipeline = Pipeline(self.name, [
+            Stage(name, process, min(serviceConfig.pipelineWorkers.get(name, 1), maxWorkers or sys.maxsize),
+                  serviceConfig.pipelineQueueSize)
+            for name, process, maxWorkers in self.stages()])
+
+    #(name, loader) of the components of the backend, loaded in order
+    def components(self):
+        raise NotImplementedError
+
+    def isLoaded(self):
+        raise NotImplementedError
+
+    #Drops the models of the backend
+    def unloadModels(self):
+        raise NotImplementedError
+
+    #(name, process, most workers or None) of the stages of a batch, each one processing the output
+    #of the previous one: the first one the (text, embed) requests, the last one returns their waveforms
+    def stages(self):
+        raise NotImplementedError
+
+    #Requests are only batched with the ones of the same key, None batches them all together
+    def batchKey(self, text, embed):
+        return None
+
+    #Synthesizes a batch of (text, embed) requests in the calling thread, returning one waveform per request
+    def synthesizeBatch(self, requests):
+        return self.pipeline.run(requests)
+
+    #Hands a batch to the pipeline, returning a future of its waveforms
+    def processBatch(self, requests):
+        if not serviceConfig.pipelined:
+            return self.synthesizeBatch(requests)
+        return self.pipeline.submitAsync(requests)
+
+    @property
+    def sampleRate(self):
+        raise NotImplementedError
+
+    #Parameters the generated audio depends on, besides the text and the embeds
+    def params(self):
+        return {}
+
+    #Final processing of a whole synthesized text
+    def finish(self, wav):
+        return wav
+
+    #Loads every component, reporting their state when the backend is tracked
+    def load(self):
+        for name, load in self.components():
+            if self.readiness is not None:
+                self.readiness.run(self.name + "/" + name, load)
+            else:
+                load()
+
+    #Loads the models again after an unload, called with the lock held. The startup readiness
+    #is only told the components are back, so the other backends keep serving meanwhile.
+    def reload(self):
+        print("Loading backend", self.name)
+        self.state = "loading"
+        start = time.time()
+        try:
+            for name, load in self.components():
+                load()
+        except Exception:
+            self.state = "failed"
+            raise
+        self.state = "loaded"
+        if self.readiness is not None:
+            for name, load in self.components():
+                self.readiness.mark(self.name + "/" + name, "ready")
+        print("Loaded backend", self.name, "in %.1fs" % (time.time() - start))
+
+    #Loads the backend if it is not loaded, the requests of an unloaded backend wait for it
+    def ensureLoaded(self):
+        with self.lock:
+            if not self.isLoaded():
+                self.reload()
+
+    #Unloads the backend unless a request is using it
+    def unload(self):
+        with self.lock:
+            if not self.isLoaded() or self.inFlight:
+                return False
+            print("Unloading backend", self.name)
+            self.unloadModels()
+            self.state = "unloaded"
+            if self.readiness is not None:
+                for name, load in self.components():
+                    self.readiness.mark(self.name + "/" + name, "unloaded")
+        return True
+
+    #Queues a piece of text, returning a future of its waveform. The backend is loaded and the
+    #request counted in flight under the same lock, so it cannot be unloaded in between.
+    def submitAsync(self, text, embed):
+        startMonitor()
+        with self.lock:
+            if not self.isLoaded():
+                self.reload()
+            self.inFlight += 1
+            self.lastUsed = time.time()
+        future = self.batcher.submitAsync((text, embed))
+        future.add_done_callback(self.done)
+        return future
+
+    def done(self, future):
+        with self.lock:
+            self.inFlight -= 1
+            self.lastUsed = time.time()
+
+    #Synthesizes a whole text. When 'deadline' (a time.time()) passes first, the text is
+    #dropped if it did not start yet and futures.TimeoutError is raised.
+    def synthesize(self, text, embed, deadline=None):
+        future = self.submitAsync(text, embed)
+        try:
+            wav = future.result(None if deadline is None else max(0.0, deadline - time.time()))
+        except futures.TimeoutError:
+            future.cancel()
+            raise
+        return self.finish(wav)
+
+    def describe(self):
+        with self.lock:
+            return {
+                'loaded': self.isLoaded(),
+                'state': self.state or ("loaded" if self.isLoaded() else "pending"),
+                'inFlight': self.inFlight,
+                'queued': self.batcher.depth(),
+                'pipeline': self.pipeline.stats(),
+                'idleSeconds': time.time() - self.lastUsed if not self.inFlight else 0.0
+            }
+
+#Creates the backends named in 'names' on 'device'
+def create(names, device):
+    for name in names:
+        if name not in available:
+            raise ValueError("Unknown backend " + name + ", expected one of " + ", ".join(available))
+        moduleName, className = available[name]
+        module = importlib.import_module(moduleName)
+        registry[name] = getattr(module, className)(device)
+    return registry
+
+#Returns the backend named 'name', or None
+def get(name):
+    return registry.get(name)
+
+#Fraction of the memory still available, the lowest of the host and the gpu
+def availableMemory():
+    fractions = []
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = dict(line.split(":", 1) for line in f)
+        fractions.append(int(meminfo["MemAvailable"].split()[0]) / int(meminfo["MemTotal"].split()[0]))
+    except (OSError, KeyError, ValueError):
+        pass
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        free, total = torch.cuda.mem_get_info()
+        fractions.append(free / total)
+    return min(fractions) if fractions else 1.0
+
+#Unloads the idle backends, least recently used first, while the memory is low
+def unloadIdle(idleSeconds, lowFraction):
+    unloaded = []
+    idle = sorted((backend for backend in registry.values() if backend.isLoaded()),
+                  key=lambda backend: backend.lastUsed)
+    for backend in idle:
+        if availableMemory() >= lowFraction:
+            break
+        if time.time() - backend.lastUsed >= idleSeconds and backend.unload():
+            unloaded.append(backend.name)
+    if unloaded:
+        #give the memory of the unloaded models back
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+            torch.cuda.empty_cache()
+    return unloaded
+
+monitor = {'thread': None}
+monitorLock = threading.Lock()
+
+#Starts the memory pressure monitor on first use, so it runs in the process that serves requests
+def startMonitor():
+    with monitorLock:
+        if monitor['thread'] is not None and monitor['thread'].is_alive():
+            return
+        def loop():
+            while True:
+                time.sleep(serviceConfig.memoryCheckSeconds)
+                unloadIdle(serviceConfig.backendIdleSeconds, serviceConfig.memoryLowFraction)
+        monitor['thread'] = threading.Thread(target=loop, daemon=True)
+        monitor['thread'].start()
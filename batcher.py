@@ -0,0 +1,101 @@
+from concurrent.futures import Future
+import threading
+import queue
+import time
+
+#Collects the requests arriving within a short window and processes them together.
+#'process' receives a list of items and must return a list with one result per item,
+#or a future of that list, the next batch is then collected while it is processed.
+#With a 'key' function only the items of equal keys are batched together, the other ones
+#wait for a later batch, the oldest one first.
+class Batcher:
+    def __init__(self, process, maxBatchSize=8, maxWaitMs=20, key=None):
+        self.process = process
+        self.maxBatchSize = max(1, maxBatchSize)
+        self.maxWait = maxWaitMs / 1000.0
+        self.key = key
+        self.pending = queue.Queue()
+        #requests set aside for a batch of their key, only used by the worker thread
+        self.deferred = []
+        self.thread = None
+        self.lock = threading.Lock()
+
+    #Starts the worker thread on first use, so it is created in the process that serves requests
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.loop, daemon=True)
+                self.thread.start()
+
+    #Queues an item and returns a future of its result
+    def submitAsync(self, item):
+        self.start()
+        future = Future()
+        #the key is computed in the thread of the request
+        key = self.key(item) if self.key is not None else None
+        self.pending.put((item, future, key))
+        return future
+
+    #Queues an item and waits for its result
+    def submit(self, item):
+        return self.submitAsync(item).result()
+
+    #Number of requests waiting for a batch
+    def depth(self):
+        return self.pending.qsize() + len(self.deferred)
+
+    #Waits for the first request, then gathers others of its key until the batch is full or the window closes
+    def collect(self):
+        first = self.deferred.pop(0) if self.deferred else self.pending.get()
+        batch = [first]
+        #the requests set aside earlier join first
+        for request in [request for request in self.deferred if request[2] == first[2]][:self.maxBatchSize - 1]:
+            self.deferred.remove(request)
+            batch.append(request)
+        deadline = time.monotonic() + self.maxWait
+        while len(batch) < self.maxBatchSize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request[2] == first[2]:
+                batch.append(request)
+            else:
+                self.deferred.append(request)
+        return [(item, future) for item, future, key in batch]
+
+    def loop(self):
+        while True:
+            batch = self.collect()
+            #requests cancelled while waiting are not processed
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.process([item for item, future in batch])
+            except Exception as e:
+                self.fail(batch, e)
+                continue
+            if isinstance(results, Future):
+                results.add_done_callback(lambda done, batch=batch: self.resolve(batch, done))
+            else:
+                self.distribute(batch, results)
+
+    #Gives every request of 'batch' its result
+    def distribute(self, batch, results):
+        for (item, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def fail(self, batch, exception):
+        for item, future in batch:
+            future.set_exception(exception)
+
+    #Gives every request of 'batch' its result from the future 'done' of the batch
+    def resolve(self, batch, done):
+        if done.exception() is not None:
+            self.fail(batch, done.exception())
+        else:
+            self.distribute(batch, done.result())
@@ -0,0 +1,322 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import argparse
+import platform
+import resource
+import threading
+import json
+import time
+import sys
+import os
+
+#Offline benchmark of the synthesis pipeline.
+#The pretrained models are replaced by the random-weight stand-ins of stubModels, so the
+#benchmark runs on cpu without checkpoints. The requests go through the real service code
+#(audioFromEmbeds and run_voiceCloning, the batchers, the text frontend and the audio decoding).
+
+#Text the benchmark texts are cut from
+corpus = ("It is a truth universally acknowledged, that a single man in possession of a good fortune, "
+          "must be in want of a wife. However little known the feelings or views of such a man may be "
+          "on his first entering a neighbourhood, this truth is so well fixed in the minds of the "
+          "surrounding families, that he is considered the rightful property of some one or other of "
+          "their daughters. My dear Mr. Bennet, said his lady to him one day, have you heard that "
+          "Netherfield Park is let at last? Mr. Bennet replied that he had not.")
+
+#Text of about 'length' characters, cut at a word boundary
+def benchmarkText(length):
+    text = corpus
+    while len(text) < length:
+        text = text + " " + corpus
+    cut = text.rfind(" ", 0, length + 1)
+    return text[:cut if cut > 0 else length]
+
+#Reference voice: a few seconds of a voiced, pitch varying signal encoded as 'format',
+#a different voice for every 'seed'
+def referenceAudio(audioIO, seconds, format="wav", seed=0):
+    t = np.arange(int(seconds * audioIO.referenceRate)) / audioIO.referenceRate
+    f0 = 120 + 7 * (seed % 20) + 30 * np.sin(2 * np.pi * (0.5 + 0.05 * seed) * t)
+    phase = 2 * np.pi * np.cumsum(f0) / audioIO.referenceRate
+    wav = sum(np.sin(k * phase) / k for k in range(1, 12)) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    wav = wav + 0.01 * np.random.RandomState(seed).randn(len(t))
+    return audioIO.encodeAudio((0.3 * wav).astype(np.float32), audioIO.referenceRate, format)
+
+#Resident memory (bytes) of the process
+def residentMemory():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+#Samples the resident memory in the background and keeps its peak
+class PeakMemory:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, residentMemory())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = residentMemory()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, residentMemory())
+
+#Replaces the pretrained models of the service by the stand-ins
+def installStubs(service, backends, hidden):
+    import stubModels
+
+    service.encoder = stubModels.StubEncoder(hidden)
+    service.speakerEncoder.encoder = service.encoder
+    for backend in backends.registry.values():
+        if backend.name == "flowtron":
+            def loadFlowtron(backend=backend):
+                backend.flowtron = backend.device.flowtron(stubModels.StubFlowtron(hidden=hidden))
+                backend.hookGates()
+            def loadWaveglow(backend=backend):
+                model = stubModels.StubWaveGlow(hop_length=backend.data_config['hop_length'])
+                backend.waveglow = backend.device.waveglow(model)
+            backend.loadFlowtron = loadFlowtron
+            backend.loadWaveglow = loadWaveglow
+        elif backend.name == "sv2tts":
+            def loadSynthesizer(backend=backend):
+                backend.synthesizer = stubModels.StubSynthesizer(hidden)
+            def loadVocoder(backend=backend):
+                vocoder = stubModels.StubVocoder(stubModels.StubSynthesizer.hparams.hop_size, hidden)
+                vocoder.load_model()
+                backend.vocoder = vocoder
+            backend.loadSynthesizer = loadSynthesizer
+            backend.loadVocoder = loadVocoder
+
+#Count, total and mean seconds of every stage observed between two metrics.stageSeconds totals
+def stageTimes(before, after):
+    stages = {}
+    for key, (count, total) in after.items():
+        oldCount, oldTotal = before.get(key, (0, 0.0))
+        if count == oldCount:
+            continue
+        stage = stages.setdefault(dict(key)['stage'], {'count': 0, 'seconds': 0.0})
+        stage['count'] += count - oldCount
+        stage['seconds'] += total - oldTotal
+    for stage in stages.values():
+        stage['mean'] = stage['seconds'] / stage['count']
+    return stages
+
+#Runs 'repeats' rounds of 'batchSize' concurrent requests, batched together by the backend
+def runCase(service, metrics, backend, path, text, batchSize, repeats, embed, reference):
+    if path == "cloning":
+        request = lambda i: service.run_voiceCloning(reference, text, backend)
+    else:
+        request = lambda i: service.audioFromEmbeds(text, embed, backend)
+
+    def timed(i):
+        start = time.perf_counter()
+        wav = request(i)
+        return time.perf_counter() - start, len(wav) / backend.sampleRate
+
+    #the batch closes as soon as every request of the round has joined it
+    backend.batcher.maxBatchSize = batchSize
+    backend.batcher.maxWait = 1.0 if batchSize > 1 else 0.0
+
+    latencies = []
+    audioSeconds = 0.0
+    before = metrics.stageSeconds.totals()
+    with PeakMemory() as memory, ThreadPoolExecutor(batchSize) as pool:
+        start = time.perf_counter()
+        for r in range(repeats):
+            for latency, seconds in pool.map(timed, range(batchSize)):
+                latencies.append(latency)
+                audioSeconds += seconds
+        elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend.name,
+        'path': path,
+        'textLength': len(text),
+        'batchSize': batchSize,
+        'requests': len(latencies),
+        'latencyMedian': float(np.median(latencies)),
+        'latencyP90': float(np.percentile(latencies, 90)),
+        'latencyMax': float(np.max(latencies)),
+        'requestsPerSecond': len(latencies) / elapsed,
+        'audioSecondsPerSecond': audioSeconds / elapsed,
+        'realTimeFactor': elapsed / audioSeconds if audioSeconds else 0.0,
+        'peakMemoryMb': memory.peak / 2 ** 20,
+        'stages': stageTimes(before, metrics.stageSeconds.totals())
+    }
+
+#Seconds per text of the flowtron text frontend, once the dictionaries are loaded
+def runFrontend(backend, lengths, repeats):
+    results = []
+    for length in lengths:
+        text = benchmarkText(length)
+        start = time.perf_counter()
+        for i in range(repeats):
+            sequence = backend.trainset.get_text(text)
+        seconds = (time.perf_counter() - start) / repeats
+        results.append({'textLength': len(text), 'symbols': len(sequence), 'seconds': seconds,
+                        'charactersPerSecond': len(text) / seconds})
+    return results
+
+#Largest difference between the mel spectrograms of every text decoded alone and together with the
+#other texts, batched by the batcher of the backend, without sampling noise. Padding a text changes
+#what Flowtron decodes, so the batched spectrograms must match the ones decoded alone.
+def runBatchParity(backend, embed, lengths, batchSize):
+    import serviceConfig
+    from batcher import Batcher
+
+    decode = lambda requests: backend.acoustic(backend.frontend(requests))[0]
+    texts = [benchmarkText(length) for length in lengths]
+    sigma = serviceConfig.flowtronSigma
+    serviceConfig.flowtronSigma = 0.0
+    try:
+        alone = [decode([(text, embed)])[0] for text in texts]
+        batcher = Batcher(decode, batchSize, 200, key=lambda request: backend.batchKey(*request))
+        #every text is sent twice, so each one is decoded in a batch
+        batched = [batcher.submitAsync((text, embed)) for text in texts + texts]
+        batched = [future.result() for future in batched]
+    finally:
+        serviceConfig.flowtronSigma = sigma
+
+    results = []
+    for i, text in enumerate(texts):
+        differences = [float((mel - alone[i]).abs().max()) if mel.shape == alone[i].shape else float("inf")
+                       for mel in (batched[i], batched[len(texts) + i])]
+        results.append({'textLength': len(text), 'maxDifference': max(differences)})
+    return results
+
+def caseKey(case):
+    return (case['backend'], case['path'], case['textLength'], case['batchSize'])
+
+#Adds the ratios against the matching cases of 'baseline', returning the keys of the regressed cases
+def compare(report, baseline, tolerance):
+    baselineCases = {caseKey(case): case for case in baseline.get('cases', [])}
+    regressions = []
+    for case in report['cases']:
+        old = baselineCases.get(caseKey(case))
+        if old is None:
+            continue
+        case['baseline'] = {
+            'latencyRatio': case['latencyMedian'] / old['latencyMedian'],
+            'throughputRatio': case['audioSecondsPerSecond'] / old['audioSecondsPerSecond'],
+            'memoryRatio': case['peakMemoryMb'] / old['peakMemoryMb']
+        }
+        if case['baseline']['latencyRatio'] > 1 + tolerance or case['baseline']['throughputRatio'] < 1 / (1 + tolerance):
+            regressions.append(caseKey(case))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the synthesis pipeline on cpu with random-weight models")
+    parser.add_argument("--backends", default="flowtron,sv2tts")
+    parser.add_argument("--paths", nargs="+", default=["embeds", "cloning"], choices=["embeds", "cloning"],
+                        help="embeds: synthesis from an embedding, cloning: from the uploaded reference audio")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[20, 80, 200], help="text lengths (characters)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--hidden", type=int, default=256, help="hidden size of the stand-in models")
+    parser.add_argument("--reference-seconds", type=float, default=5.0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="report of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown reported as a regression")
+    parser.add_argument("--parity-tolerance", type=float, default=1e-3,
+                        help="largest difference between a text decoded alone and batched")
+    args = parser.parse_args()
+
+    #the service reads its configuration on import: cpu, no cached embeds, batches as large as the largest case
+    os.environ["VC_DEVICE"] = "cpu"
+    os.environ["VC_PRECISION"] = args.precision
+    os.environ["VC_CPU_THREADS"] = str(args.threads)
+    os.environ["VC_BACKENDS"] = args.backends
+    os.environ["VC_EMBED_CACHE_SIZE"] = "0"
+    os.environ["VC_EMBED_CACHE_DIR"] = ""
+    os.environ["VC_BATCH_MAX_SIZE"] = str(max(args.batch_sizes))
+    import service
+    import backends
+    import metrics
+    import audioIO
+    import torch
+
+    installStubs(service, backends, args.hidden)
+    service.loadEncoder()
+    reference = referenceAudio(audioIO, args.reference_seconds)
+    embed = service.referenceEmbed(reference)
+
+    report = {
+        'config': {
+            'backends': list(backends.registry),
+            'precision': args.precision,
+            'threads': torch.get_num_threads(),
+            'hidden': args.hidden,
+            'referenceSeconds': args.reference_seconds,
+            'repeats': args.repeats,
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__
+        },
+        'cases': [],
+        'frontend': [],
+        'batchParity': []
+    }
+
+    for backend in backends.registry.values():
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            backend.load()
+            loadSeconds = time.perf_counter() - start
+        report['config'][backend.name] = {'loadSeconds': loadSeconds, 'peakMemoryMb': memory.peak / 2 ** 20}
+        #the first synthesis pays for the lazy initializations
+        service.audioFromEmbeds("Warm up.", embed, backend)
+
+        if backend.name == "flowtron":
+            report['frontend'] = runFrontend(backend, args.lengths, 20 * args.repeats)
+            report['batchParity'] = runBatchParity(backend, embed, args.lengths, 2 * len(args.lengths))
+            for result in report['batchParity']:
+                print("flowtron %4d chars  alone vs batched max difference %.2e" % (result['textLength'], result['maxDifference']))
+
+        for path in args.paths:
+            for length in args.lengths:
+                text = benchmarkText(length)
+                for batchSize in args.batch_sizes:
+                    case = runCase(service, metrics, backend, path, text, batchSize, args.repeats, embed, reference)
+                    report['cases'].append(case)
+                    print("%-8s %-7s %4d chars  batch %2d  latency %.3fs  %6.2f req/s  RTF %.3f  peak %.0fMB" % (
+                        backend.name, path, case['textLength'], batchSize, case['latencyMedian'],
+                        case['requestsPerSecond'], case['realTimeFactor'], case['peakMemoryMb']))
+
+    report['peakMemoryMb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for case in report['cases']:
+            if 'baseline' in case:
+                print("%-8s %-7s %4d chars  batch %2d  latency x%.2f  throughput x%.2f" % (
+                    case['backend'], case['path'], case['textLength'], case['batchSize'],
+                    case['baseline']['latencyRatio'], case['baseline']['throughputRatio']))
+        report['regressions'] = [list(key) for key in regressions]
+        print(len(regressions), "regressions above", "%d%%" % (args.tolerance * 100))
+
+    mismatches = [result for result in report['batchParity'] if result['maxDifference'] > args.parity_tolerance]
+    if mismatches:
+        print(len(mismatches), "texts decoded differently batched than alone")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    sys.exit(1 if regressions or mismatches else 0)
+
+if __name__ == "__main__":
+    main()
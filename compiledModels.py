@@ -0,0 +1,176 @@
+from torch.nn.utils import parametrize
+import torch.nn.functional as F
+import torch.nn as nn
+import waveglowInfer
+import argparse
+import torch
+import json
+import os
+
+#Compiled mode: WaveGlow's inference is traced once into a TorchScript graph, with the weight
+#normalization removed and the inverses of the invertible convolutions folded in as constants.
+#The graph is saved next to the checkpoint and loaded on the next starts instead of it,
+#after a parity check against the eager inference when it is built.
+
+#Removes the weight normalization of every layer of 'model', folding it into the weights
+def removeWeightNorm(model):
+    for module in model.modules():
+        if hasattr(module, "weight_g"):
+            torch.nn.utils.remove_weight_norm(module)
+        elif parametrize.is_parametrized(module, "weight"):
+            parametrize.remove_parametrizations(module, "weight")
+    return model
+
+#Noise function handing out consecutive channels of 'z', in the order waveglowInfer.infer asks for them
+def noiseFrom(z):
+    position = [0]
+    def noise(*shape):
+        chunk = z[:, position[0]:position[0] + shape[1]]
+        position[0] += shape[1]
+        return chunk
+    return noise
+
+#WaveGlow's inference as a traceable module. The noise of all the channels is an input
+#(sigma included): the initial audio first, then the channels of the early outputs.
+class WaveGlowInverse(nn.Module):
+    def __init__(self, waveglow, dtype):
+        nn.Module.__init__(self)
+        self.upsample = waveglow.upsample
+        self.WN = waveglow.WN
+        self.n_flows = waveglow.n_flows
+        self.n_early_every = waveglow.n_early_every
+        self.n_early_size = waveglow.n_early_size
+        self.n_remaining_channels = waveglow.n_remaining_channels
+        self.timeCutoff = waveglow.upsample.kernel_size[0] - waveglow.upsample.stride[0]
+        self.n_group = waveglow.n_group
+        for k, conv in enumerate(waveglow.convinv):
+            self.register_buffer("inverse%d" % k, waveglowInfer.convinvInverse(conv, dtype).detach().clone())
+
+    def forward(self, spect, noise):
+        spect = self.upsample(spect)
+        spect = spect[:, :, :-self.timeCutoff]
+        spect = spect.unfold(2, self.n_group, self.n_group).permute(0, 2, 1, 3)
+        spect = spect.contiguous().view(spect.size(0), spect.size(1), -1).permute(0, 2, 1)
+
+        audio = noise[:, :self.n_remaining_channels]
+        used = self.n_remaining_channels
+        for k in reversed(range(self.n_flows)):
+            n_half = int(audio.size(1) / 2)
+            audio_0 = audio[:, :n_half, :]
+            audio_1 = audio[:, n_half:, :]
+
+            output = self.WN[k]((audio_0, spect))
+
+            s = output[:, n_half:, :]
+            b = output[:, :n_half, :]
+            audio_1 = (audio_1 - b) / torch.exp(s)
+            audio = torch.cat([audio_0, audio_1], 1)
+
+            audio = F.conv1d(audio, getattr(self, "inverse%d" % k))
+
+            if k % self.n_early_every == 0 and k > 0:
+                audio = torch.cat((noise[:, used:used + self.n_early_size], audio), 1)
+                used += self.n_early_size
+
+        return audio.permute(0, 2, 1).contiguous().view(audio.size(0), -1)
+
+#A loaded compiled WaveGlow
+class CompiledWaveGlow:
+    def __init__(self, module, meta):
+        self.module = module
+        self.n_group = meta['n_group']
+        self.hopLength = meta['hop_length']
+
+    #Same as waveglowInfer.infer
+    def infer(self, spect, sigma, noise):
+        length = spect.size(2) * self.hopLength // self.n_group
+        z = noise(spect.size(0), self.n_group, length).to(spect.dtype)
+        return self.module(spect, sigma * z)
+
+#Path of the compiled WaveGlow of 'checkpointPath' for a device and a precision
+def compiledPath(checkpointPath, device):
+    version = torch.__version__.split("+")[0]
+    return "%s.%s-%s-torch%s.ts" % (os.path.splitext(checkpointPath)[0], device.torch.type, device.waveglowPrecision(), version)
+
+#Random spectrograms of a few lengths, with their noise, to check the compiled graph
+def parityInputs(device, n_mel_channels, hopLength, n_group, dtype):
+    generator = torch.Generator().manual_seed(0)
+    inputs = []
+    for frames in (37, 80):
+        spect = torch.randn(1, n_mel_channels, frames, generator=generator) - 5
+        z = torch.randn(1, n_group, frames * hopLength // n_group, generator=generator)
+        inputs.append((spect.to(device.torch, dtype), z.to(device.torch, dtype)))
+    return inputs
+
+#Largest difference between the eager and the compiled outputs, relative to the eager peak
+def parityError(references, compiled, inputs, sigma):
+    error = 0.0
+    for reference, (spect, z) in zip(references, inputs):
+        with torch.no_grad():
+            output = compiled(spect, sigma * z).float()
+        error = max(error, float((output - reference).abs().max() / reference.abs().max().clamp(min=1e-8)))
+    return error
+
+#Traces the eager 'waveglow', already prepared for 'device', checking it against the eager inference.
+#Returns the compiled module and its parity error.
+def compileWaveglow(waveglow, device, hopLength, sigma):
+    dtype = device.waveglowInput(torch.zeros(1)).dtype
+    inputs = parityInputs(device, waveglow.upsample.in_channels, hopLength, waveglow.n_group, dtype)
+    with torch.no_grad():
+        references = [waveglowInfer.infer(waveglow, spect, sigma, noise=noiseFrom(z)).float() for spect, z in inputs]
+
+        inverse = WaveGlowInverse(removeWeightNorm(waveglow), dtype).eval()
+        spect, z = inputs[0]
+        traced = torch.jit.trace(inverse, (spect, sigma * z), check_trace=False)
+        compiled = torch.jit.freeze(traced.eval())
+    return compiled, parityError(references, compiled, inputs, sigma)
+
+#Compiled WaveGlow of 'checkpointPath' for 'device', loaded from the disk when it was built after the
+#checkpoint, otherwise traced from the eager model returned by 'loadEager' and saved.
+#Returns None when the device cannot run it or the compiled graph differs from the eager one.
+def loadWaveglow(checkpointPath, device, loadEager, hopLength, sigma, tolerance):
+    if device.precision == "bf16":
+        print("Compiled WaveGlow unavailable in bf16, using the eager one")
+        return None
+
+    path = compiledPath(checkpointPath, device)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(checkpointPath):
+        extra = {'meta.json': ""}
+        module = torch.jit.load(path, map_location=device.torch, _extra_files=extra)
+        return CompiledWaveGlow(module, json.loads(extra['meta.json']))
+
+    waveglow = loadEager()
+    compiled, error = compileWaveglow(waveglow, device, hopLength, sigma)
+    if error > tolerance:
+        print("Compiled WaveGlow differs from the eager one (%.2e > %.2e), using the eager one" % (error, tolerance))
+        return None
+    print("Compiled WaveGlow saved to", path, "(parity error %.2e)" % error)
+
+    meta = {'n_group': waveglow.n_group, 'hop_length': hopLength, 'parityError': error}
+    #saved under a temporary name first, so a crash never leaves a partial graph, unique to the
+    #process as the workers may compile at the same time
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    torch.jit.save(compiled, tmpPath, _extra_files={'meta.json': json.dumps(meta)})
+    os.replace(tmpPath, path)
+    return CompiledWaveGlow(compiled, meta)
+
+#Parity check of the compiled WaveGlow against the eager one, on the checkpoint of the Flowtron backend
+def main():
+    from flowtronBackend import FlowtronBackend, waveglowPath
+    from device import Device, precisions
+    import serviceConfig
+
+    parser = argparse.ArgumentParser(description="Compiles WaveGlow and checks it against the eager model")
+    parser.add_argument("--device", default=serviceConfig.device)
+    parser.add_argument("--precision", default=serviceConfig.precision, choices=precisions)
+    parser.add_argument("--tolerance", type=float, default=serviceConfig.compiledTolerance)
+    args = parser.parse_args()
+
+    backend = FlowtronBackend(Device(args.device, args.precision))
+    hopLength = backend.data_config['hop_length']
+    compiled, error = compileWaveglow(backend.eagerWaveglow(), backend.device, hopLength, serviceConfig.waveglowSigma)
+    print("Parity error %.2e, tolerance %.2e:" % (error, args.tolerance), "passed" if error <= args.tolerance else "FAILED")
+    raise SystemExit(0 if error <= args.tolerance else 1)
+
+if __name__ == "__main__":
+    main()
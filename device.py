@@ -0,0 +1,92 @@
+from contextlib import nullcontext
+
+#the stub backend and the stand-in encoder run without torch, on the cpu
+try:
+    import torch
+except ImportError:
+    torch = None
+
+precisions = ("fp16", "fp32", "bf16", "int8")
+
+#The device and precision the models run with
+class Device:
+    def __init__(self, name="cuda", precision="fp16", threads=0, interopThreads=0):
+        if precision not in precisions:
+            raise ValueError("Unknown precision " + precision + ", expected one of " + ", ".join(precisions))
+        if name.startswith("cuda") and precision == "int8":
+            raise ValueError("int8 quantization is only available on cpu")
+        if name == "cpu" and precision == "fp16":
+            raise ValueError("fp16 is only available on cuda")
+
+        if torch is None and name != "cpu":
+            raise ValueError("torch is required to run on " + name)
+
+        self.name = name
+        self.precision = precision
+        self.torch = torch.device(name) if torch is not None else None
+
+        if self.torch is not None and self.torch.type == "cpu":
+            if threads > 0:
+                torch.set_num_threads(threads)
+            if interopThreads > 0:
+                try:
+                    torch.set_num_interop_threads(interopThreads)
+                except RuntimeError:
+                    #only possible before the first parallel work of the process
+                    print("Could not set the inter-op threads, parallel work already started")
+
+    def isCuda(self):
+        return self.torch is not None and self.torch.type == "cuda"
+
+    #Standard normal noise of the given shape on the device
+    def noise(self, *shape):
+        return torch.randn(*shape, device=self.torch)
+
+    #Context the models run in, autocasting to bfloat16 in bf16 mode
+    def autocast(self):
+        if self.precision == "bf16":
+            return torch.autocast(device_type=self.torch.type, dtype=torch.bfloat16)
+        return nullcontext()
+
+    #Dynamic int8 quantization of the layers torch supports (linear and recurrent ones)
+    def quantize(self, model):
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}, dtype=torch.qint8)
+
+    #Prepares Flowtron for inference on the device
+    def flowtron(self, model):
+        model = model.to(self.torch).eval()
+        if self.precision == "int8":
+            model = self.quantize(model)
+        return model
+
+    #Precision WaveGlow runs in: it is convolutional, so int8 has no layer to quantize and runs it in fp32
+    def waveglowPrecision(self):
+        return "fp32" if self.precision == "int8" else self.precision
+
+    #Prepares WaveGlow for inference on the device
+    def waveglow(self, model):
+        model = model.to(self.torch).eval()
+        if self.precision == "fp16":
+            #the invertible convolutions are kept in float for their inverses
+            model.half()
+            for k in model.convinv:
+                k.float()
+        elif self.precision == "int8":
+            print("WaveGlow has no linear or recurrent layer to quantize, it runs in fp32 with int8 (Flowtron is quantized)")
+        return model
+
+    #Converts mel spectrograms to the type WaveGlow expects
+    def waveglowInput(self, mels):
+        if self.precision == "fp16":
+            return mels.half()
+        return mels.float()
+
+#Loads a checkpoint memory-mapped when its format allows it, so the weights are
+#paged in on use and shared with the other processes through the page cache
+def loadCheckpoint(path, mapLocation):
+    try:
+        return torch.load(path, map_location=mapLocation, mmap=True)
+    except (TypeError, RuntimeError):
+        #older torch or checkpoint saved in the legacy format
+        return torch.load(path, map_location=mapLocation)
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import os
+
+#Content addressed cache of speaker embeddings.
+#Embeddings are keyed by the hash of the uploaded reference audio bytes and kept
+#in a bounded in-memory LRU, backed by an optional directory of saved .npy files
+#that survives restarts.
+class EmbedCache:
+    def __init__(self, maxSize=256, directory=None):
+        self.maxSize = maxSize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    #Key of an uploaded audio file
+    @staticmethod
+    def keyFor(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def diskPath(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    #Returns the cached embedding for 'key' or None
+    def get(self, key):
+        with self.lock:
+            embed = self.entries.get(key)
+            if embed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embed
+
+        if self.directory and os.path.exists(self.diskPath(key)):
+            try:
+                embed = np.load(self.diskPath(key))
+            except (OSError, ValueError):
+                embed = None
+            if embed is not None:
+                with self.lock:
+                    self.diskHits += 1
+                self.remember(key, embed)
+                return embed
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    #Keeps 'embed' in memory, evicting the least recently used entries
+    def remember(self, key, embed):
+        with self.lock:
+            self.entries[key] = embed
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    #Stores a freshly computed embedding in all tiers
+    def put(self, key, embed):
+        self.remember(key, embed)
+        if self.directory:
+            #write to a temporary file first, so a crash never leaves a partial embedding; its name is
+            #unique to the thread, so concurrent misses on the same audio do not share it
+            tmpPath = "%s.%d.%d.tmp" % (self.diskPath(key), os.getpid(), threading.get_ident())
+            with open(tmpPath, "wb") as f:
+                np.save(f, embed)
+            os.replace(tmpPath, self.diskPath(key))
+
+    #Returns the cached embedding for 'data', computing it with 'compute' on a miss
+    def getOrCompute(self, data, compute):
+        key = self.keyFor(data)
+        embed = self.get(key)
+        if embed is None:
+            embed = compute()
+            self.put(key, embed)
+        return embed
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.diskHits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxSize': self.maxSize,
+                'hits': self.hits,
+                'diskHits': self.diskHits,
+                'misses': self.misses,
+                'hitRate': (self.hits + self.diskHits) / lookups if lookups else 0.0
+            }
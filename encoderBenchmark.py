@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from speakerEncoder import SpeakerEncoder
+import numpy as np
+import argparse
+import benchmark
+import audioIO
+import json
+import time
+
+#Throughput of the speaker encoder under concurrent uploads: every upload encoded on its own
+#(embed_utterance, the previous path) against the uploads batched together by SpeakerEncoder.
+#With --stub the random-weight stand-in of stubModels is used, without checkpoints.
+
+#Preprocessed reference clips of a few seconds each
+def clips(encoder, count, seconds):
+    wav = encoder.preprocess_wav(audioIO.decodeAudio(benchmark.referenceAudio(audioIO, seconds), encoder.sampling_rate),
+                                 encoder.sampling_rate)
+    #the clips differ, so nothing could be shared between the requests
+    return [np.roll(wav, 997 * i) for i in range(count)]
+
+#Uploads per second of 'embed' with 'concurrency' requests at a time, and the embeds
+def measure(embed, wavs, concurrency):
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(embed, wavs[:concurrency]))
+        start = time.perf_counter()
+        embeds = list(pool.map(embed, wavs))
+        elapsed = time.perf_counter() - start
+    return len(wavs) / elapsed, np.stack(embeds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the speaker encoder under concurrent uploads")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of the uploaded clips")
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--max-partials", type=int, default=64)
+    parser.add_argument("--stub", action="store_true", help="random-weight encoder instead of the pretrained one")
+    parser.add_argument("--output", default="encoder_benchmark.json")
+    args = parser.parse_args()
+
+    if args.stub:
+        import stubModels
+        encoder = stubModels.StubEncoder()
+    else:
+        from encoder import inference as encoder
+        from pathlib import Path
+        encoder.load_model(Path("encoder/saved_models/pretrained.pt"))
+
+    wavs = clips(encoder, args.uploads, args.seconds)
+    report = {'uploads': args.uploads, 'seconds': args.seconds, 'stub': args.stub, 'cases': []}
+    for concurrency in args.concurrency:
+        speakerEncoder = SpeakerEncoder(encoder, concurrency, args.max_wait_ms, args.max_partials)
+        alone, reference = measure(encoder.embed_utterance, wavs, concurrency)
+        batched, embeds = measure(speakerEncoder.embed, wavs, concurrency)
+        case = {
+            'concurrency': concurrency,
+            'aloneUploadsPerSecond': alone,
+            'batchedUploadsPerSecond': batched,
+            'speedup': batched / alone,
+            'maxEmbedDifference': float(np.abs(embeds - reference).max())
+        }
+        report['cases'].append(case)
+        print("concurrency %2d  alone %6.1f uploads/s  batched %6.1f uploads/s  x%.2f  max difference %.1e" % (
+            concurrency, alone, batched, case['speedup'], case['maxEmbedDifference']))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
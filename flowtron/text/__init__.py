@@ -1,25 +1,51 @@
 """ from https://github.com/keithito/tacotron """
 import re
+import threading
+from functools import lru_cache
 from text import cleaners
 from text.symbols import symbols
 from text.symbols import _punctuation as punctuation_symbols
+from text.compactdict import CompactDict, build_word_list, open_compact
 
 # Mappings from symbol to numeric ID and vice versa:
 _symbol_to_id = {s: i for i, s in enumerate(symbols)}
 _id_to_symbol = {i: s for i, s in enumerate(symbols)}
 
 # Regular expression matching text enclosed in curly braces:
-_curly_re = re.compile(r'(.*?)\{(.+?)\}(.*)')
+_curly_group_re = re.compile(r'\{(.+?)\}')
+
+# Punctuation at the start and at the end of a word:
+_start_punc_re = re.compile(r"\A\W+")
+_end_punc_re = re.compile(r"\W+\Z")
+
+# Maximum number of words whose ARPAbet is memoized:
+_arpabet_cache_size = 65536
 
 # for arpabet with apostrophe
 _apostrophe = re.compile(r"(?=\S*['])([a-zA-Z'-]+)")
 
+# Sentence boundaries: terminal punctuation, optional closing quotes/brackets, then whitespace
+_sentence_end_re = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+
+# Clause boundaries used to break sentences that are too long
+_clause_end_re = re.compile(r'(?<=[,;:])\s+')
+
+# Words, keeping ARPAbet in curly braces together
+_word_re = re.compile(r'(?:\{[^}]*\}|\S)+')
+
+# Abbreviations whose period does not end a sentence
+_abbreviations = set(['mr', 'mrs', 'ms', 'dr', 'st', 'jr', 'sr', 'co', 'vs', 'etc',
+                      'prof', 'gen', 'rev', 'mt', 'ft', 'no', 'e.g', 'i.e'])
+
 def text_to_sequence(text):
     '''Converts a string of text to a sequence of IDs corresponding to the symbols in the text.
 
         The text can optionally have ARPAbet sequences enclosed in curly braces embedded
         in it. For example, "Turn left on {HH AW1 S S T AH0 N} Street."
 
+        ARPAbet is only recognized on the first line; when that line contains any,
+        the lines following it are dropped.
+
         Args:
             text: string to convert to a sequence
             cleaner_names: names of the cleaner functions to run the text through
@@ -27,21 +53,72 @@ def text_to_sequence(text):
         Returns:
             List of integers corresponding to the symbols in the text
     '''
+    line = text.partition('\n')[0]
     sequence = []
+    position = 0
 
     # Check for curly braces and treat their contents as ARPAbet:
-    while len(text):
-        m = _curly_re.match(text)
-        if not m:
-            sequence += _symbols_to_sequence(text)
-            break
-        sequence += _symbols_to_sequence(m.group(1))
-        sequence += _arpabet_to_sequence(m.group(2))
-        text = m.group(3)
+    for m in _curly_group_re.finditer(line):
+        sequence += _symbols_to_sequence(line[position:m.start()])
+        sequence += _arpabet_to_sequence(m.group(1))
+        position = m.end()
+
+    if position == 0:
+        return _symbols_to_sequence(text)
 
+    sequence += _symbols_to_sequence(line[position:])
     return sequence
 
 
+def split_sentences(text, max_length=200):
+    '''Splits a text into sentences that can be synthesized one at a time.
+
+        Sentences longer than max_length characters are further split at clause
+        boundaries and, if still too long, between words.
+
+        Args:
+            text: string to split
+            max_length: maximum number of characters of a piece
+
+        Returns:
+            List of non-empty strings
+    '''
+    sentences = []
+    for part in _sentence_end_re.split(text.strip()):
+        if not part:
+            continue
+        # periods after abbreviations do not end the sentence
+        if sentences and sentences[-1].split()[-1].rstrip('.').lower() in _abbreviations:
+            sentences[-1] = sentences[-1] + ' ' + part
+        else:
+            sentences.append(part)
+
+    pieces = []
+    for sentence in sentences:
+        pieces += _split_long(sentence, max_length)
+    return pieces
+
+
+def _split_long(sentence, max_length):
+    if len(sentence) <= max_length:
+        return [sentence]
+
+    pieces = []
+    for clause in _clause_end_re.split(sentence):
+        if pieces and len(pieces[-1]) + 1 + len(clause) <= max_length:
+            pieces[-1] = pieces[-1] + ' ' + clause
+        elif len(clause) <= max_length:
+            pieces.append(clause)
+        else:
+            # no clause boundary is close enough, split between words
+            for word in _word_re.findall(clause):
+                if pieces and len(pieces[-1]) + 1 + len(word) <= max_length:
+                    pieces[-1] = pieces[-1] + ' ' + word
+                else:
+                    pieces.append(word)
+    return pieces
+
+
 def sequence_to_text(sequence):
     '''Converts a sequence of IDs back to a string'''
     result = ''
@@ -66,31 +143,52 @@ def _clean_text(text, cleaner_names):
 
 
 def _symbols_to_sequence(symbols):
+    if isinstance(symbols, str):
+        # every kept character is translated to the character whose code point is its ID
+        return list(map(ord, symbols.translate(_char_id_table)))
     return [_symbol_to_id[s] for s in symbols if _should_keep_symbol(s)]
 
 
 def _arpabet_to_sequence(text):
-    return _symbols_to_sequence(['@' + s for s in text.split()])
+    return [_arpabet_to_id[s] for s in text.split() if s in _arpabet_to_id]
 
 
 def _should_keep_symbol(s):
-    return s in _symbol_to_id and s is not '_' and s is not '~'
+    return s in _symbol_to_id and s != '_' and s != '~'
+
+
+class _DeletingTable(dict):
+    '''str.translate table deleting the characters it does not map'''
+    def __missing__(self, key):
+        self[key] = None
+        return None
+
+
+# Single character symbols kept in sequences, for str.translate:
+_char_id_table = _DeletingTable(
+    (ord(s), chr(i)) for s, i in _symbol_to_id.items() if len(s) == 1 and _should_keep_symbol(s))
+
+# ARPAbet symbols without their '@' prefix:
+_arpabet_to_id = {s[1:]: i for s, i in _symbol_to_id.items()
+                  if len(s) > 1 and s[0] == '@' and _should_keep_symbol(s)}
 
 
 def get_arpabet(word, cmudict, index=0):
-    re_start_punc = r"\A\W+"
-    re_end_punc = r"\W+\Z"
+    return _get_arpabet(word, cmudict, index)
+
 
-    start_symbols = re.findall(re_start_punc, word)
-    if len(start_symbols):
-        start_symbols = start_symbols[0]
+@lru_cache(maxsize=_arpabet_cache_size)
+def _get_arpabet(word, cmudict, index):
+    start_symbols = _start_punc_re.search(word)
+    if start_symbols is not None:
+        start_symbols = start_symbols.group(0)
         word = word[len(start_symbols):]
     else:
         start_symbols = ''
 
-    end_symbols = re.findall(re_end_punc, word)
-    if len(end_symbols):
-        end_symbols = end_symbols[0]
+    end_symbols = _end_punc_re.search(word)
+    if end_symbols is not None:
+        end_symbols = end_symbols.group(0)
         word = word[:-len(end_symbols)]
     else:
         end_symbols = ''
@@ -117,4 +215,42 @@ def files_to_list(filename):
     files = [f.rstrip() for f in files]
     return files
 
-HETERONYMS = set(files_to_list('flowtron/data/heteronyms'))
+class _LazyWordSet:
+    '''Set of the lines of a file, opened on its first use instead of at import time.
+
+        It is read from its compact memory-mapped file when that can be built.
+    '''
+    def __init__(self, filename):
+        self._filename = filename
+        self._words = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._words is None:
+            with self._lock:
+                if self._words is None:
+                    path = open_compact(self._filename, build_word_list)
+                    self._words = set(files_to_list(self._filename)) if path is None else CompactDict(path)
+        return self._words
+
+    def is_loaded(self):
+        return self._words is not None
+
+    def __contains__(self, word):
+        return word in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+def load_dictionaries():
+    '''Loads the heteronyms and the CMU dictionary ahead of their first use'''
+    from text.acronyms import cmudict
+    HETERONYMS.load()
+    cmudict.load()
+
+
+HETERONYMS = _LazyWordSet('flowtron/data/heteronyms')
@@ -1,5 +1,7 @@
 import re
+import threading
 from .cmudict import CMUDict
+from .compactdict import CompactCMUDict, build_cmudict, open_compact
 
 _letter_to_arpabet = {
     'A': 'EY1',
@@ -31,9 +33,50 @@ _letter_to_arpabet = {
     's': 'Z'
 }
 
+
+
+class LazyCMUDict:
+    '''CMUDict opened on its first use instead of at import time.
+
+        It is read from its compact memory-mapped file, built next to the
+        dictionary when it is missing or older than it.
+    '''
+    def __init__(self, file_or_path, keep_ambiguous=True):
+        self._file_or_path = file_or_path
+        self._keep_ambiguous = keep_ambiguous
+        self._dict = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._dict is None:
+            with self._lock:
+                if self._dict is None:
+                    self._dict = self._open()
+        return self._dict
+
+    def _open(self):
+        if isinstance(self._file_or_path, str):
+            path = open_compact(self._file_or_path, build_cmudict)
+            if path is not None:
+                return CompactCMUDict(path, keep_ambiguous=self._keep_ambiguous)
+        return CMUDict(self._file_or_path, keep_ambiguous=self._keep_ambiguous)
+
+    def is_loaded(self):
+        return self._dict is not None
+
+    def lookup(self, word):
+        return self.load().lookup(word)
+
+    def __len__(self):
+        return len(self.load())
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
 # must ignore roman numerals
 _acronym_re = re.compile(r'([A-Z][A-Z]+)s?|([A-Z]\.([A-Z]\.)+s?)')
-cmudict = CMUDict('flowtron/data/cmudict_dictionary', keep_ambiguous=False)
+cmudict = LazyCMUDict('flowtron/data/cmudict_dictionary', keep_ambiguous=False)
 
 
 def _expand_acronyms(m, add_spaces=True):
@@ -0,0 +1,205 @@
+""" Compact, memory-mapped store of the pronunciation dictionary and the word lists """
+import os
+import mmap
+import array
+import struct
+import threading
+
+# File layout, native byte order:
+#   header: magic, number of keys, number of values, number of keys with a single value
+#   key offsets (uint32, keys + 1), value ranges of the keys (uint32, keys + 1),
+#   value offsets (uint32, values + 1), sorted utf-8 keys, utf-8 values
+_magic = b'CPD1'
+_header = struct.Struct('=4sIII')
+
+
+def build(entries, path):
+    '''Writes a dictionary {key: [values]} (or an iterable of keys) to path.
+
+        The file is written under a temporary name first, unique to the process
+        and thread, so a crash never leaves a partial one and concurrent builds
+        do not write the same file.
+    '''
+    if not isinstance(entries, dict):
+        entries = dict((key, []) for key in entries)
+    keys = sorted(entries, key=lambda key: key.encode('utf-8'))
+
+    key_offsets = array.array('I', [0])
+    value_ranges = array.array('I', [0])
+    value_offsets = array.array('I', [0])
+    key_blob = bytearray()
+    value_blob = bytearray()
+    unambiguous = 0
+    for key in keys:
+        key_blob += key.encode('utf-8')
+        key_offsets.append(len(key_blob))
+        for value in entries[key]:
+            value_blob += value.encode('utf-8')
+            value_offsets.append(len(value_blob))
+        value_ranges.append(len(value_offsets) - 1)
+        unambiguous += len(entries[key]) == 1
+
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp_path, 'wb') as f:
+        f.write(_header.pack(_magic, len(keys), len(value_offsets) - 1, unambiguous))
+        for part in (key_offsets, value_ranges, value_offsets):
+            f.write(part.tobytes())
+        f.write(key_blob)
+        f.write(value_blob)
+    os.replace(tmp_path, path)
+
+
+def is_fresh(path, source_path):
+    '''True when the compact file at path was built after its source'''
+    return os.path.exists(path) and (
+        not os.path.exists(source_path) or os.path.getmtime(path) >= os.path.getmtime(source_path))
+
+
+class CompactDict:
+    '''Read-only dictionary mapped from a file built by build().
+
+        Nothing is parsed when it is opened: the keys are found by binary search
+        in the mapped file, so processes opening the same file share its pages.
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._keys, self._values, self._unambiguous = _header.unpack_from(self._map)
+        if magic != _magic:
+            raise ValueError('%s is not a compact dictionary' % path)
+
+        view = memoryview(self._map)
+        position = _header.size
+        self._key_offsets = view[position:position + 4 * (self._keys + 1)].cast('I')
+        position += 4 * (self._keys + 1)
+        self._value_ranges = view[position:position + 4 * (self._keys + 1)].cast('I')
+        position += 4 * (self._keys + 1)
+        self._value_offsets = view[position:position + 4 * (self._values + 1)].cast('I')
+        position += 4 * (self._values + 1)
+        self._key_start = position
+        self._value_start = position + self._key_offsets[self._keys]
+
+    def _key(self, i):
+        return self._map[self._key_start + self._key_offsets[i]:self._key_start + self._key_offsets[i + 1]]
+
+    def _find(self, key):
+        '''Index of key, or -1'''
+        key = key.encode('utf-8')
+        low, high = 0, self._keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._keys and self._key(low) == key:
+            return low
+        return -1
+
+    def _value(self, j):
+        start = self._value_start + self._value_offsets[j]
+        return self._map[start:self._value_start + self._value_offsets[j + 1]].decode('utf-8')
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        if i < 0:
+            return default
+        return [self._value(j) for j in range(self._value_ranges[i], self._value_ranges[i + 1])]
+
+    def count(self, key):
+        '''Number of values of key, 0 when it is missing'''
+        i = self._find(key)
+        return 0 if i < 0 else self._value_ranges[i + 1] - self._value_ranges[i]
+
+    def unambiguous(self):
+        '''Number of keys with a single value'''
+        return self._unambiguous
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for i in range(self._keys):
+            yield self._key(i).decode('utf-8')
+
+    def __len__(self):
+        return self._keys
+
+
+class CompactCMUDict:
+    '''CMUDict with the same lookup semantics, read from a compact file.
+
+        All the pronunciations are stored; the ambiguous words are left out at
+        lookup when keep_ambiguous is False, like CMUDict does when parsing.
+    '''
+    def __init__(self, path, keep_ambiguous=True):
+        self._dict = CompactDict(path)
+        self._keep_ambiguous = keep_ambiguous
+
+    def lookup(self, word):
+        '''Returns list of ARPAbet pronunciations of the given word.'''
+        pronunciations = self._dict.get(word.upper())
+        if pronunciations is not None and not self._keep_ambiguous and len(pronunciations) != 1:
+            return None
+        return pronunciations
+
+    def __len__(self):
+        return len(self._dict) if self._keep_ambiguous else self._dict.unambiguous()
+
+
+def compact_path(source_path):
+    return source_path + '.compact'
+
+
+_build_lock = threading.Lock()
+
+
+def build_cmudict(source_path, path=None):
+    '''Builds the compact file of a CMU dictionary, returning its path'''
+    from text.cmudict import CMUDict
+    path = path or compact_path(source_path)
+    build(CMUDict(source_path, keep_ambiguous=True)._entries, path)
+    return path
+
+
+def build_word_list(source_path, path=None):
+    '''Builds the compact file of a list of words, one per line, returning its path'''
+    from text import files_to_list
+    path = path or compact_path(source_path)
+    build(files_to_list(source_path), path)
+    return path
+
+
+def open_compact(source_path, builder):
+    '''Path of the up to date compact file of source_path, built when it is missing or stale.
+
+        Returns None when it cannot be written, the source is then parsed instead.
+    '''
+    path = compact_path(source_path)
+    with _build_lock:
+        if not is_fresh(path, source_path):
+            try:
+                builder(source_path, path)
+            except OSError as e:
+                print('Compact dictionary', path, 'could not be built:', e)
+                return None
+    return path
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Builds the compact pronunciation dictionary and heteronym list')
+    parser.add_argument('--cmudict', default='flowtron/data/cmudict_dictionary')
+    parser.add_argument('--heteronyms', default='flowtron/data/heteronyms')
+    args = parser.parse_args()
+
+    sys.path.insert(0, 'flowtron')
+    for source_path, builder in ((args.cmudict, build_cmudict), (args.heteronyms, build_word_list)):
+        path = builder(source_path)
+        print('Built', path, '(%d entries, %.1f MB)' % (len(CompactDict(path)), os.path.getsize(path) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+from backends import Backend
+from device import loadCheckpoint
+from speakingRate import SpeakingRates
+from compiledModels import CompiledWaveGlow
+import compiledModels
+import waveglowInfer
+import vocoding
+import metrics
+import serviceConfig
+import numpy as np
+import threading
+import torch
+import json
+import math
+import sys
+
+sys.path.insert(0, "flowtron")
+from flowtron import Flowtron
+from data import Data
+from text import load_dictionaries
+from text.acronyms import LazyCMUDict
+
+sys.path.insert(0, "flowtron/tacotron2")
+sys.path.insert(0, "flowtron/tacotron2/waveglow")
+#needed to unpickle the WaveGlow checkpoint
+from glow import WaveGlow
+
+#WaveGlow checkpoint, its compiled graphs are saved next to it
+waveglowPath = "flowtron/tacotron2/waveglow/saved_models/waveglow_256channels_universal_v5.pt"
+
+#Log mel value of silence, padding the spectrograms of a batch
+silentMel = math.log(1e-5)
+
+#Flowtron + WaveGlow backend
+class FlowtronBackend(Backend):
+    name = "flowtron"
+
+    def __init__(self, device):
+        Backend.__init__(self, device)
+        self.flowtron = None
+        self.waveglow = None
+        self.trainset = None
+        #Records the gate outputs of the Flowtron decoder while a batch is synthesized,
+        #the lock keeps the batches decoded outside of the pipeline from sharing it
+        self.gateCapture = {'module': None, 'gates': []}
+        self.decodeLock = threading.Lock()
+        #Frames per symbol of the voices, sizing the residual of the texts
+        self.speakingRates = SpeakingRates(serviceConfig.flowtronFramesPerSymbol, serviceConfig.flowtronRateHeadroom)
+
+        # Parse configs
+        with open("flowtron/infer.json") as f:
+            config = json.loads(f.read())
+        self.data_config = config["data_config"]
+        self.model_config = config["model_config"]
+
+        if device.isCuda():
+            torch.backends.cudnn.enabled = True
+            torch.backends.cudnn.benchmark = False
+
+        torch.manual_seed(serviceConfig.seed)
+        if device.isCuda():
+            torch.cuda.manual_seed(serviceConfig.seed)
+
+    @property
+    def sampleRate(self):
+        return self.data_config['sampling_rate']
+
+    def params(self):
+        return {
+            'sigma': serviceConfig.flowtronSigma,
+            'gate_threshold': serviceConfig.flowtronGateThreshold,
+            'waveglow_sigma': serviceConfig.waveglowSigma
+        }
+
+    def components(self):
+        return [
+            ("waveglow", self.loadWaveglow),
+            ("flowtron", self.loadFlowtron),
+            ("trainset", self.loadTrainset),
+            ("text", load_dictionaries)
+        ]
+
+    def isLoaded(self):
+        return self.flowtron is not None and self.waveglow is not None and self.trainset is not None
+
+    def unloadModels(self):
+        self.flowtron = None
+        self.waveglow = None
+
+    #WaveGlow of the checkpoint, prepared for the device
+    def eagerWaveglow(self):
+        checkpoint = loadCheckpoint(waveglowPath, self.device.torch)
+        return self.device.waveglow(checkpoint['model'])
+
+    def loadWaveglow(self):
+        if serviceConfig.compiled:
+            self.waveglow = compiledModels.loadWaveglow(waveglowPath, self.device, self.eagerWaveglow,
+                                                        self.data_config['hop_length'], serviceConfig.waveglowSigma,
+                                                        serviceConfig.compiledTolerance)
+            if self.waveglow is not None:
+                return
+        self.waveglow = self.eagerWaveglow()
+
+    def loadFlowtron(self):
+        model = Flowtron(**self.model_config)
+        state_dict = loadCheckpoint("flowtron/saved_models/pretrained.pt", 'cpu')['model'].state_dict()
+        model.load_state_dict(state_dict)
+        self.flowtron = self.device.flowtron(model)
+        self.hookGates()
+
+    def loadTrainset(self):
+        ignore_keys = ['training_files', 'validation_files']
+        self.trainset = Data(
+            self.data_config['training_files'],
+            **dict((k, v) for k, v in self.data_config.items() if k not in ignore_keys))
+        #the parsed dictionary of the trainset is replaced by the compact one, shared by the worker processes
+        self.trainset.cmudict = LazyCMUDict(self.data_config['cmudict_path'],
+                                            keep_ambiguous=self.data_config.get('keep_ambiguous', False))
+
+    #Flowtron stops decoding on a single gate value, so during a batch the gate is reduced
+    #to its minimum: decoding goes on until every request has passed the threshold.
+    #The per request gates are kept to find out where each request ended.
+    def gateHook(self, module, inputs, output):
+        if self.gateCapture['module'] is not module:
+            self.gateCapture['module'] = module
+            self.gateCapture['gates'] = []
+        self.gateCapture['gates'].append(torch.sigmoid(output.detach().float()).reshape(-1))
+        return output.min().reshape([1] * output.dim())
+
+    #Installs gateHook on the gate layers of flowtron
+    def hookGates(self):
+        for name, module in self.flowtron.named_modules():
+            if name.split('.')[-1] == "gate_layer":
+                module.register_forward_hook(self.gateHook)
+
+    #Number of mel frames produced for each request, from the step its gate passed the threshold,
+    #and whether the gate stopped it (None when the gates were not recorded)
+    def gateLengths(self, batchSize, nFrames, gate_threshold):
+        gates = self.gateCapture['gates']
+        lengths = [nFrames] * batchSize
+        stopped = [None] * batchSize
+        if not gates or gates[0].numel() != batchSize:
+            return lengths, stopped
+        passed = (torch.stack(gates) > gate_threshold).cpu()
+        for i in range(batchSize):
+            steps = passed[:, i].nonzero()
+            stopped[i] = len(steps) > 0
+            if len(steps):
+                lengths[i] = min(nFrames, int(steps[0]) + 1)
+        return lengths, stopped
+
+    #Residual frames needed by the longest request of a batch at the speaking rate of its voice
+    def residualFrames(self, symbols, voices):
+        frames = max(math.ceil(n * self.speakingRates.rate(voice)) for n, voice in zip(symbols, voices))
+        return min(max(frames, serviceConfig.flowtronMinFrames), serviceConfig.flowtronMaxFrames)
+
+    #Decodes the padded texts with a residual of 'nFrames' frames, returning the mel spectrograms,
+    #the frames of every request and whether its gate stopped it
+    def decode(self, text, embeds, nFrames):
+        device = self.device
+        with self.decodeLock:
+            self.gateCapture['module'] = None
+            self.gateCapture['gates'] = []
+            with torch.no_grad(), device.autocast():
+                residual = device.noise(text.size(0), 80, nFrames) * serviceConfig.flowtronSigma
+                mels, attentions = self.flowtron.infer(
+                    residual, embeds, text, gate_threshold=serviceConfig.flowtronGateThreshold)
+            lengths, stopped = self.gateLengths(text.size(0), mels.size(2), serviceConfig.flowtronGateThreshold)
+        return mels, lengths, stopped
+
+    #Vocodes the mel spectrograms in one WaveGlow pass, padded with silence to the longest one
+    def vocodeWindows(self, mels):
+        device = self.device
+        batch = mels[0].new_full((len(mels), mels[0].size(0), max(mel.size(1) for mel in mels)), silentMel)
+        for i, mel in enumerate(mels):
+            batch[i, :, :mel.size(1)] = mel
+
+        with torch.no_grad(), device.autocast():
+            if isinstance(self.waveglow, CompiledWaveGlow):
+                audio = self.waveglow.infer(device.waveglowInput(batch), serviceConfig.waveglowSigma, device.noise)
+            else:
+                audio = waveglowInfer.infer(self.waveglow, device.waveglowInput(batch),
+                                            sigma=serviceConfig.waveglowSigma, noise=device.noise)
+        audio = audio.float().cpu().numpy()
+        return [audio[i, :mel.size(1) * self.data_config['hop_length']] for i, mel in enumerate(mels)]
+
+    #Frontend, Flowtron and WaveGlow stages. Flowtron records its gates in the backend, so it decodes
+    #one batch at a time: one worker in the pipeline, and decodeLock for the batches run inline.
+    def stages(self):
+        return [
+            ("frontend", self.frontend, None),
+            ("acoustic", self.acoustic, 1),
+            ("vocoder", self.vocoder, None)
+        ]
+
+    #Flowtron has no text mask or lengths: its encoder and its attention would see the padding of
+    #the shorter texts of a batch, so only the texts of the same number of symbols are batched
+    def batchKey(self, text, embed):
+        return len(self.trainset.get_text(text))
+
+    #Texts and embeds of a batch of (text, embed) requests, padded and on the device
+    def frontend(self, requests):
+        device = self.device
+        with metrics.stage("frontend", backend=self.name):
+            texts = [self.trainset.get_text(text) for text, embed in requests]
+            embeds = [self.trainset.get_embeds([embed]) for text, embed in requests]
+            voices = [SpeakingRates.keyFor(embed) for text, embed in requests]
+
+            #padding the texts with the pad symbol (id 0) to the longest one
+            text = torch.zeros(len(texts), max(len(t) for t in texts), dtype=texts[0].dtype)
+            for i, t in enumerate(texts):
+                text[i, :len(t)] = t
+            text = text.to(device.torch)
+            embeds = torch.stack(embeds).to(device.torch)
+
+        return text, embeds, voices, [len(t) for t in texts]
+
+    #Mel spectrograms of a batch with one Flowtron pass, and their number of frames
+    def acoustic(self, batch):
+        text, embeds, voices, symbols = batch
+        nFrames = self.residualFrames(symbols, voices)
+        with metrics.stage("acoustic", backend=self.name):
+            mels, lengths, stopped = self.decode(text, embeds, nFrames)
+            mels = [mels[i, :, :length] for i, length in enumerate(lengths)]
+
+            #the texts reaching the end of the residual were cut off, they are decoded again with a longer one
+            cut = [i for i, s in enumerate(stopped) if s is False]
+            while cut and nFrames < serviceConfig.flowtronMaxFrames:
+                nFrames = min(2 * nFrames, serviceConfig.flowtronMaxFrames)
+                retried, retriedLengths, retriedStopped = self.decode(text[cut], embeds[cut], nFrames)
+                for j, i in enumerate(cut):
+                    mels[i] = retried[j, :, :retriedLengths[j]]
+                    lengths[i] = retriedLengths[j]
+                    stopped[i] = retriedStopped[j]
+                cut = [i for i in cut if stopped[i] is False]
+
+        for i, s in enumerate(stopped):
+            if s is None:
+                continue
+            metrics.decoderStops.inc(backend=self.name, reason="gate" if s else "cap")
+            if s:
+                self.speakingRates.observe(voices[i], symbols[i], lengths[i])
+            else:
+                print("Text of", symbols[i], "symbols cut off at", lengths[i], "frames")
+        return mels, lengths
+
+    #Generate audio for the mel spectrograms of a batch with batched WaveGlow passes
+    def vocoder(self, batch):
+        mels, lengths = batch
+        with metrics.stage("vocoder", backend=self.name):
+            audio = vocoding.vocode(mels, self.vocodeWindows, self.data_config['hop_length'],
+                                    serviceConfig.vocoderChunkFrames, serviceConfig.vocoderOverlapFrames,
+                                    serviceConfig.vocoderMaxFrames)
+
+        results = []
+        with metrics.stage("normalize", backend=self.name):
+            for i, length in enumerate(lengths):
+                #splitting the batch back into requests
+                wav = audio[i][:length * self.data_config['hop_length']]
+                # normalize audio for now
+                results.append(wav / np.abs(wav).max())
+
+        return results
+
+    def describe(self):
+        description = Backend.describe(self)
+        description['speakingRate'] = self.speakingRates.stats()
+        return description
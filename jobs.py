@@ -0,0 +1,100 @@
+import threading
+import queue
+import time
+import uuid
+
+#A queued synthesis request
+class Job:
+    def __init__(self, run, filename, mimeType):
+        self.id = uuid.uuid4().hex
+        self.run = run
+        self.filename = filename
+        self.mimeType = mimeType
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def describe(self):
+        description = {
+            'id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished
+        }
+        if self.status == "done":
+            description['result'] = "/audio/jobs/" + self.id + "/result"
+        if self.status == "failed":
+            description['error'] = self.error
+        return description
+
+#Runs jobs on a fixed number of worker threads and keeps their results for 'ttl' seconds
+class JobQueue:
+    def __init__(self, workers=2, ttl=600):
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    #Starts the workers on first use, so they are created in the process that serves requests
+    def start(self):
+        with self.lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.loop, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    #Queues 'run', a function returning the bytes of the result, and returns the job
+    def submit(self, run, filename, mimeType):
+        self.start()
+        self.expire()
+        job = Job(run, filename, mimeType)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.pending.put(job)
+        return job
+
+    #Returns the job with the given id, or None when unknown or expired
+    def get(self, jobId):
+        self.expire()
+        with self.lock:
+            return self.jobs.get(jobId)
+
+    #Forgets the results that were kept longer than the ttl
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            expired = [jobId for jobId, job in self.jobs.items()
+                       if job.finished is not None and now - job.finished > self.ttl]
+            for jobId in expired:
+                del self.jobs[jobId]
+
+    def stats(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    #Runs the queued jobs. Idle workers wake up every so often to expire the old results,
+    #so they do not stay in memory when no job is submitted or polled.
+    def loop(self):
+        while True:
+            try:
+                job = self.pending.get(timeout=max(1.0, min(60.0, self.ttl / 2)))
+            except queue.Empty:
+                self.expire()
+                continue
+            job.status = "running"
+            try:
+                job.result = job.run()
+                job.status = "done"
+            except Exception as e:
+                print("Job failed:", job.id, e)
+                job.error = str(e) or type(e).__name__
+                job.status = "failed"
+            job.run = None
+            job.finished = time.time()
+            self.expire()
@@ -0,0 +1,316 @@
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import numpy as np
+import threading
+import argparse
+import tempfile
+import benchmark
+import json
+import time
+import uuid
+import sys
+import os
+
+#Load generator of the HTTP service: synthetic reference clips and texts of controlled lengths are
+#posted to /audio/create and /audio/example/<name> at a fixed concurrency (closed loop) or at a
+#fixed arrival rate (open loop, Poisson arrivals), and the latencies, throughput and errors reported.
+#With --serve-stub the service is started in this process on the stub backend and the stand-in
+#speaker encoder, so the HTTP, I/O and scheduling overhead is measured without the models.
+
+examples = ["obama", "ramsay", "hawking"]
+
+#Draws lengths from a distribution given as "fixed:N", "uniform:LOW:HIGH" or "lognormal:MEDIAN:SIGMA"
+class Lengths:
+    def __init__(self, spec):
+        self.spec = spec
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.values = [float(value) for value in parts[1:]]
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if self.kind not in expected or len(self.values) != expected[self.kind]:
+            raise argparse.ArgumentTypeError("Expected fixed:N, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA, got " + spec)
+
+    def draw(self, random):
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return random.uniform(self.values[0], self.values[1])
+        return self.values[0] * np.exp(self.values[1] * random.randn())
+
+#Text of about 'length' characters starting at a random word of the corpus, so the texts
+#of the requests differ and do not come from the result cache
+def randomText(random, length):
+    text = benchmark.benchmarkText(int(length) + len(benchmark.corpus))
+    start = text.find(" ", random.randint(len(benchmark.corpus))) + 1
+    text = text[start:]
+    cut = text.rfind(" ", 0, int(length) + 1)
+    return text[:cut if cut > 0 else max(1, int(length))]
+
+#Body and content type of a multipart/form-data request with 'files' [(name, filename, bytes)] and 'fields'
+def multipartBody(files, fields):
+    boundary = uuid.uuid4().hex
+    body = b""
+    for name, value in fields.items():
+        body += ('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary, name, value)).encode("utf-8")
+    for name, filename, data in files:
+        body += ('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                 'Content-Type: application/octet-stream\r\n\r\n' % (boundary, name, filename)).encode("utf-8")
+        body += data + b"\r\n"
+    body += ("--%s--\r\n" % boundary).encode("utf-8")
+    return body, "multipart/form-data; boundary=" + boundary
+
+#Builds the requests: the endpoint is drawn from 'mix', the text length and the clip from their distributions
+class Workload:
+    def __init__(self, mix, textLengths, clips, fields, seed):
+        self.endpoints = list(mix)
+        total = float(sum(mix.values()))
+        self.weights = [mix[endpoint] / total for endpoint in self.endpoints]
+        self.textLengths = textLengths
+        self.clips = clips
+        self.fields = fields
+        self.random = np.random.RandomState(seed)
+        self.lock = threading.Lock()
+
+    #(endpoint, path, body, content type) of the next request
+    def next(self):
+        with self.lock:
+            endpoint = self.endpoints[self.random.choice(len(self.endpoints), p=self.weights)]
+            text = randomText(self.random, max(1, self.textLengths.draw(self.random))).encode("utf-8")
+            name = "load%d" % self.random.randint(1 << 30)
+            if endpoint == "create":
+                clip = self.clips[self.random.randint(len(self.clips))]
+                files = [("file", name + ".mp3", clip), ("file", name + ".txt", text)]
+                path = "/audio/create"
+            else:
+                files = [("file", name + ".txt", text)]
+                path = "/audio/example/" + examples[self.random.randint(len(examples))]
+        body, contentType = multipartBody(files, self.fields)
+        return endpoint, path, body, contentType
+
+#Sends the requests over one keep-alive connection per thread
+class Client:
+    def __init__(self, host, port, timeout, headers):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.headers = headers
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.local.connection
+
+    #Status (0 for a connection error) and size of the response
+    def post(self, path, body, contentType):
+        headers = dict(self.headers)
+        headers['Content-Type'] = contentType
+        try:
+            connection = self.connection()
+            connection.request("POST", path, body, headers)
+            response = connection.getresponse()
+            size = len(response.read())
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+                self.local.connection = None
+            return response.status, size
+        except (OSError, http.client.HTTPException):
+            if getattr(self.local, "connection", None) is not None:
+                self.local.connection.close()
+            self.local.connection = None
+            return 0, 0
+
+#Results of the requests: (endpoint, status, latency, bytes, end time)
+class Recorder:
+    def __init__(self):
+        self.results = []
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, status, latency, size):
+        with self.lock:
+            self.results.append((endpoint, status, latency, size, time.perf_counter()))
+
+#Runs one request and records it; the latency counts from 'scheduled', the time it should have been sent
+def runOne(workload, client, recorder, scheduled=None):
+    endpoint, path, body, contentType = workload.next()
+    start = time.perf_counter() if scheduled is None else scheduled
+    status, size = client.post(path, body, contentType)
+    recorder.record(endpoint, status, time.perf_counter() - start, size)
+
+#Closed loop: 'concurrency' clients sending a request as soon as their previous one is answered
+def closedLoop(workload, client, recorder, concurrency, duration, requests):
+    deadline = time.perf_counter() + duration
+    counter = {'sent': 0}
+    lock = threading.Lock()
+
+    def loop():
+        while time.perf_counter() < deadline:
+            with lock:
+                if requests and counter['sent'] >= requests:
+                    return
+                counter['sent'] += 1
+            runOne(workload, client, recorder)
+
+    threads = [threading.Thread(target=loop, daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+#Open loop: requests sent at exponentially distributed intervals averaging 'rate' per second, whatever
+#the latency of the previous ones. The latency counts from the planned send time, so requests held
+#back by the 'maxInFlight' limit of the generator are not hidden.
+def openLoop(workload, client, recorder, rate, duration, requests, maxInFlight, seed):
+    random = np.random.RandomState(seed + 1)
+    start = time.perf_counter()
+    scheduled = start
+    sent = 0
+    with ThreadPoolExecutor(maxInFlight) as pool:
+        while scheduled - start < duration and (not requests or sent < requests):
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(runOne, workload, client, recorder, scheduled)
+            sent += 1
+            scheduled += random.exponential(1.0 / rate)
+
+#Latency percentiles (s), throughput and error rates of 'results', overall and by endpoint
+def summarize(results, elapsed):
+    def stats(rows):
+        latencies = [latency for endpoint, status, latency, size, end in rows if 200 <= status < 300]
+        statuses = {}
+        for endpoint, status, latency, size, end in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary = {
+            'requests': len(rows),
+            'succeeded': len(latencies),
+            'errorRate': 1 - len(latencies) / len(rows) if rows else 0.0,
+            'rejectedRate': statuses.get("429", 0) / len(rows) if rows else 0.0,
+            'statuses': statuses,
+            'requestsPerSecond': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'bytesPerSecond': sum(size for endpoint, status, latency, size, end in rows
+                                  if 200 <= status < 300) / elapsed if elapsed > 0 else 0.0
+        }
+        if latencies:
+            for name, q in (('p50', 50), ('p95', 95), ('p99', 99)):
+                summary[name] = float(np.percentile(latencies, q))
+            summary['mean'] = float(np.mean(latencies))
+            summary['max'] = float(np.max(latencies))
+        return summary
+
+    report = {'overall': stats(results), 'endpoints': {}}
+    for endpoint in sorted(set(row[0] for row in results)):
+        report['endpoints'][endpoint] = stats([row for row in results if row[0] == endpoint])
+    return report
+
+#Starts the service on the stub backend and the stand-in encoder in this process, returning its port.
+#All the 'clients' connect from 127.0.0.1, so one client may have them all in flight: the admission
+#lets them all run or wait, and only the service's own limit of active requests applies.
+def serveStub(hidden, realTimeFactor, clients):
+    os.environ["VC_ADMISSION_PER_CLIENT"] = str(clients)
+    os.environ["VC_ADMISSION_MAX_QUEUED"] = str(clients)
+    os.environ["VC_BACKENDS"] = "stub"
+    os.environ["VC_DEVICE"] = "cpu"
+    os.environ["VC_EMBED_CACHE_DIR"] = ""
+    os.environ["VC_VOICE_REGISTRY_DIR"] = tempfile.mkdtemp(prefix="voices")
+    os.environ["VC_STUB_REAL_TIME_FACTOR"] = str(realTimeFactor)
+    from werkzeug.serving import make_server
+    from stubBackend import ProjectionEncoder
+    import service
+    import audioIO
+
+    #the numpy stand-in encoder, so neither torch nor the encoder package are needed
+    service.encoder = ProjectionEncoder(hidden)
+    service.speakerEncoder.encoder = service.encoder
+    #the example voices are synthetic clips, the example audio files are not needed
+    def examplesSetup():
+        embeds = [service.referenceEmbed(benchmark.referenceAudio(audioIO, 5.0, seed=100 + i)) for i in range(3)]
+        service.barackobama, service.gordonRamsay, service.stephenHawking = embeds
+    service.examplesSetup = examplesSetup
+    service.preload()
+    service.warmup()
+    service.app.config["DEBUG"] = False
+
+    server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+def parseMix(spec):
+    mix = {}
+    for item in spec.split(","):
+        endpoint, weight = item.split("=")
+        if endpoint not in ("create", "example"):
+            raise argparse.ArgumentTypeError("Unknown endpoint " + endpoint + ", expected create or example")
+        mix[endpoint] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives the service with synthetic voice cloning requests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--serve-stub", action="store_true",
+                        help="start the service with the stub backend in this process, admitting all the requests of the "
+                             "load from one address; a real server needs VC_ADMISSION_PER_CLIENT and VC_ADMISSION_MAX_QUEUED "
+                             "of at least the concurrency (or --max-in-flight) too, or the extra requests get a 429")
+    parser.add_argument("--stub-real-time-factor", type=float, default=0.0, help="speed of the stub backend")
+    parser.add_argument("--hidden", type=int, default=64, help="hidden size of the stand-in speaker encoder")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients of the closed loop")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second of the open loop (0 for the closed loop)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="most requests in flight in the open loop")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 for no limit)")
+    parser.add_argument("--mix", type=parseMix, default=parseMix("create=1,example=1"), help="endpoint weights")
+    parser.add_argument("--text-lengths", type=Lengths, default=Lengths("lognormal:80:0.6"), help="characters per text")
+    parser.add_argument("--clip-seconds", type=Lengths, default=Lengths("uniform:3:10"), help="seconds per reference clip")
+    parser.add_argument("--clips", type=int, default=16, help="distinct reference clips")
+    parser.add_argument("--format", default=None, help="output format asked for with the 'format' field")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    if args.serve_stub:
+        clients = args.max_in_flight if args.rate > 0 else args.concurrency
+        args.host, args.port = "127.0.0.1", serveStub(args.hidden, args.stub_real_time_factor, clients)
+        print("Stub service listening on port", args.port)
+    import audioIO
+
+    random = np.random.RandomState(args.seed)
+    clips = [benchmark.referenceAudio(audioIO, max(0.5, args.clip_seconds.draw(random)), "mp3", seed=i)
+             for i in range(args.clips)]
+    fields = {'format': args.format} if args.format else {}
+    workload = Workload(args.mix, args.text_lengths, clips, fields, args.seed)
+    client = Client(args.host, args.port, args.timeout, {})
+    recorder = Recorder()
+
+    start = time.perf_counter()
+    if args.rate > 0:
+        openLoop(workload, client, recorder, args.rate, args.duration, args.requests, args.max_in_flight, args.seed)
+    else:
+        closedLoop(workload, client, recorder, args.concurrency, args.duration, args.requests)
+    elapsed = time.perf_counter() - start
+
+    report = summarize(recorder.results, elapsed)
+    report['config'] = {
+        'mode': "open" if args.rate > 0 else "closed",
+        'rate': args.rate,
+        'concurrency': args.concurrency,
+        'duration': elapsed,
+        'mix': args.mix,
+        'textLengths': args.text_lengths.spec,
+        'clipSeconds': args.clip_seconds.spec,
+        'clips': args.clips,
+        'stub': args.serve_stub,
+        'stubRealTimeFactor': args.stub_real_time_factor if args.serve_stub else None
+    }
+    for name, summary in [("overall", report['overall'])] + sorted(report['endpoints'].items()):
+        print("%-8s %5d requests  %6.2f req/s  errors %5.1f%%  p50 %s  p95 %s  p99 %s" % (
+            name, summary['requests'], summary['requestsPerSecond'], 100 * summary['errorRate'],
+            *["%.3fs" % summary[q] if q in summary else "-" for q in ("p50", "p95", "p99")]))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    sys.exit(1 if report['overall']['requests'] == 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+import threading
+import time
+
+#Metrics of the service, exposed in the Prometheus text format at /metrics
+
+#Default latency buckets (seconds)
+latencyBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#All the metrics, in the order they are rendered
+registry = []
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def formatLabels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, escape(value)) for name, value in items) + "}"
+
+def formatValue(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def header(self):
+        return ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.type)]
+
+#Value that only goes up
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, help):
+        Metric.__init__(self, name, help)
+        self.values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self):
+        with self.lock:
+            values = list(self.values.items())
+        return self.header() + ["%s%s %s" % (self.name, formatLabels(key), formatValue(value)) for key, value in values]
+
+#Value that goes up and down, or is read from 'function' when rendered
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help, function=None):
+        Metric.__init__(self, name, help)
+        self.values = {}
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.function is not None:
+            #the function returns a value, or a {labels tuple: value} dict
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+            values = list(values.items())
+        else:
+            with self.lock:
+                values = list(self.values.items())
+        return self.header() + ["%s%s %s" % (self.name, formatLabels(key), formatValue(value)) for key, value in values]
+
+#Distribution of observed values in cumulative buckets
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=latencyBuckets):
+        Metric.__init__(self, name, help)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    #Observes the duration of the block
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    #(count, sum) of the observations of every label set
+    def totals(self):
+        with self.lock:
+            return {key: (counts[-1], total) for key, (counts, total) in self.values.items()}
+
+    def render(self):
+        with self.lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        lines = self.header()
+        for key, counts, total in values:
+            for bound, count in zip(self.buckets, counts):
+                lines.append("%s_bucket%s %d" % (self.name, formatLabels(key, ("le", formatValue(bound))), count))
+            lines.append("%s_sum%s %s" % (self.name, formatLabels(key), formatValue(total)))
+            lines.append("%s_count%s %d" % (self.name, formatLabels(key), counts[-1]))
+        return lines
+
+#All the metrics in the Prometheus text format
+def render():
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+#Metrics of the request pipeline
+stageSeconds = Histogram("vc_stage_seconds", "Latency of each stage of the request pipeline")
+requestSeconds = Histogram("vc_request_seconds", "Latency of the requests by endpoint")
+requests = Counter("vc_requests_total", "Requests by endpoint and status")
+inputAudioSeconds = Counter("vc_input_audio_seconds_total", "Seconds of reference audio decoded")
+outputBytes = Counter("vc_output_bytes_total", "Bytes of encoded output audio by format")
+outputAudioSeconds = Counter("vc_output_audio_seconds_total", "Seconds of audio synthesized")
+realTimeFactor = Histogram("vc_real_time_factor", "Synthesis time divided by the duration of the synthesized audio",
+                           buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0))
+inFlight = Gauge("vc_in_flight_requests", "Requests being processed")
+voiceMatches = Counter("vc_voice_matches_total", "Uploaded voices reusing the embed of an enrolled voice")
+pipelineBusySeconds = Counter("vc_pipeline_busy_seconds_total", "Seconds the workers of each pipeline stage spent processing")
+decoderStops = Counter("vc_decoder_stops_total", "Decoded texts by the reason the decoding stopped (gate or cap)")
+
+#Times a stage of the pipeline
+def stage(name, **labels):
+    return stageSeconds.time(stage=name, **labels)
@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+import threading
+import metrics
+import queue
+import time
+
+#One stage of a pipeline: 'workers' threads taking items from a queue of at most 'queueSize'
+#items and running 'process' on them
+class Stage:
+    def __init__(self, name, process, workers=1, queueSize=2):
+        self.name = name
+        self.process = process
+        self.workers = max(1, workers)
+        self.pending = queue.Queue(max(1, queueSize))
+        #start time of the item of every busy worker, by thread
+        self.running = {}
+        self.busySeconds = 0.0
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    #Seconds the workers spent processing, including the item being processed
+    def busyTime(self, now):
+        with self.lock:
+            return self.busySeconds + sum(now - started for started in self.running.values())
+
+#Runs items through stages connected by bounded queues, every stage in its own threads, so
+#consecutive items overlap: while an item is in a stage, the next one is in the stage before.
+#A full queue blocks the stage feeding it, and in the end the caller of submitAsync.
+class Pipeline:
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = stages
+        self.threads = []
+        self.started = None
+        self.lock = threading.Lock()
+
+    #Starts the worker threads on first use, so they are created in the process that serves requests
+    def start(self):
+        with self.lock:
+            if self.threads and all(thread.is_alive() for thread in self.threads):
+                return
+            self.started = time.monotonic()
+            self.threads = []
+            for k, stage in enumerate(self.stages):
+                for i in range(stage.workers):
+                    thread = threading.Thread(target=self.loop, args=(k,), daemon=True,
+                                              name="%s-%s-%d" % (self.name, stage.name, i))
+                    thread.start()
+                    self.threads.append(thread)
+
+    #Queues an item and returns a future of its output through every stage
+    def submitAsync(self, item):
+        self.start()
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.stages[0].pending.put((item, future))
+        return future
+
+    def submit(self, item):
+        return self.submitAsync(item).result()
+
+    def loop(self, k):
+        stage = self.stages[k]
+        key = threading.get_ident()
+        while True:
+            item, future = stage.pending.get()
+            start = time.monotonic()
+            with stage.lock:
+                stage.running[key] = start
+            try:
+                output = stage.process(item)
+            except Exception as e:
+                future.set_exception(e)
+                output = None
+            finally:
+                seconds = time.monotonic() - start
+                with stage.lock:
+                    del stage.running[key]
+                    stage.busySeconds += seconds
+                    stage.processed += 1
+                metrics.pipelineBusySeconds.inc(seconds, pipeline=self.name, stage=stage.name)
+            if future.done():
+                continue
+            if k + 1 < len(self.stages):
+                self.stages[k + 1].pending.put((output, future))
+            else:
+                future.set_result(output)
+
+    #Applies the stages one after the other in the calling thread
+    def run(self, item):
+        for stage in self.stages:
+            item = stage.process(item)
+        return item
+
+    #Items queued in front of every stage
+    def depths(self):
+        return {stage.name: stage.pending.qsize() for stage in self.stages}
+
+    #Workers, queue, items processed and utilization (busy fraction of the workers since the start) of every stage
+    def stats(self):
+        now = time.monotonic()
+        elapsed = now - self.started if self.started is not None else 0.0
+        stats = {}
+        for stage in self.stages:
+            busy = stage.busyTime(now)
+            stats[stage.name] = {
+                'workers': stage.workers,
+                'queued': stage.pending.qsize(),
+                'processed': stage.processed,
+                'busySeconds': busy,
+                'utilization': busy / (elapsed * stage.workers) if elapsed > 0 else 0.0
+            }
+        return stats
@@ -0,0 +1,109 @@
+from device import Device, precisions
+import numpy as np
+import argparse
+import torch
+import json
+import time
+import os
+
+#Prompts synthesized in every precision mode
+prompts = [
+    "Hello.",
+    "The quick brown fox jumps over the lazy dog.",
+    "It is a truth universally acknowledged, that a single man in possession of a good fortune, must be in want of a wife."
+]
+
+#Signal to noise ratio (dB) of 'wav' against 'reference' on their common length
+def snr(reference, wav):
+    n = min(len(reference), len(wav))
+    error = np.sum((reference[:n] - wav[:n]) ** 2)
+    if error == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(reference[:n] ** 2) / error))
+
+#Log spectral distance (dB) between 'wav' and 'reference' on their common length
+def logSpectralDistance(reference, wav, frame=1024, hop=256):
+    n = min(len(reference), len(wav))
+    if n < frame:
+        return 0.0
+    window = np.hanning(frame)
+    frames = range(0, n - frame + 1, hop)
+    ref = np.abs(np.fft.rfft([reference[i:i + frame] * window for i in frames])) + 1e-8
+    out = np.abs(np.fft.rfft([wav[i:i + frame] * window for i in frames])) + 1e-8
+    return float(np.mean(np.sqrt(np.mean((20 * np.log10(ref / out)) ** 2, axis=1))))
+
+#Synthesizes every prompt 'repeats' times in one precision mode
+def runMode(deviceName, precision, threads, embed, repeats):
+    from flowtronBackend import FlowtronBackend
+    backend = FlowtronBackend(Device(deviceName, precision, threads))
+    backend.load()
+    rate = backend.sampleRate
+
+    outputs = []
+    latencies = []
+    audioSeconds = 0.0
+    for prompt in prompts:
+        for i in range(repeats):
+            #the same noise in every mode, so the outputs can be compared
+            torch.manual_seed(1234)
+            start = time.perf_counter()
+            wav = backend.synthesizeBatch([(prompt, embed)])[0]
+            latencies.append(time.perf_counter() - start)
+            audioSeconds += len(wav) / rate
+        outputs.append(wav)
+
+    return outputs, {
+        'waveglowPrecision': backend.device.waveglowPrecision(),
+        'latencyMedian': float(np.median(latencies)),
+        'latencyMax': float(np.max(latencies)),
+        'realTimeFactor': float(np.sum(latencies) / audioSeconds)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the quality and the latency of the precision modes")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--modes", nargs="+", default=None, help="precision modes, fp32 is always the reference")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--voice", default="barackobama.wav")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="precision_report.json")
+    args = parser.parse_args()
+
+    modes = args.modes
+    if modes is None:
+        excluded = "int8" if args.device.startswith("cuda") else "fp16"
+        modes = [mode for mode in precisions if mode != excluded]
+    modes = ["fp32"] + [mode for mode in modes if mode != "fp32"]
+
+    #the service reads its configuration on import: the speaker encoder runs on the compared device
+    #in fp32, the voice is the same for every mode
+    os.environ["VC_DEVICE"] = args.device
+    os.environ["VC_PRECISION"] = "fp32"
+    os.environ["VC_CPU_THREADS"] = str(args.threads)
+    os.environ["VC_BACKENDS"] = "flowtron"
+    import service
+
+    service.loadEncoder()
+    embed = service.exampleEmbed(args.voice)
+
+    report = {'device': args.device, 'threads': torch.get_num_threads(), 'modes': {}}
+    reference = None
+    for mode in modes:
+        outputs, result = runMode(args.device, mode, args.threads, embed, args.repeats)
+        if reference is None:
+            reference = outputs
+        result['snr'] = [snr(ref, out) for ref, out in zip(reference, outputs)]
+        result['logSpectralDistance'] = [logSpectralDistance(ref, out) for ref, out in zip(reference, outputs)]
+        result['lengthRatio'] = [len(out) / len(ref) for ref, out in zip(reference, outputs)]
+        report['modes'][mode] = result
+
+        print("%-5s latency %.3fs  RTF %.3f  SNR %s  LSD %s" % (
+            mode, result['latencyMedian'], result['realTimeFactor'],
+            " ".join("%.1f" % v for v in result['snr']),
+            " ".join("%.2f" % v for v in result['logSpectralDistance'])))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
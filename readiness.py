@@ -0,0 +1,67 @@
+import threading
+import time
+
+#Tracks the loading of the service components, so traffic is only sent to ready replicas
+class Readiness:
+    def __init__(self, components, optional=()):
+        self.components = {name: {'state': "pending"} for name in list(components) + list(optional)}
+        self.optional = set(optional)
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    #Runs 'load', recording the state of the component and how long it took
+    def run(self, name, load):
+        with self.lock:
+            self.components[name] = {'state': "loading"}
+        start = time.time()
+        try:
+            load()
+        except Exception as e:
+            print("Loading failed:", name, e)
+            with self.lock:
+                self.components[name] = {'state': "failed", 'error': str(e) or type(e).__name__}
+            raise
+        with self.lock:
+            self.components[name] = {'state': "ready", 'seconds': time.time() - start}
+
+    #Runs each group of loaders on its own thread, the loaders of a group in order, then 'after'
+    def runInBackground(self, groups, after=()):
+        def runGroup(group):
+            for name, load in group:
+                try:
+                    self.run(name, load)
+                except Exception:
+                    return
+
+        def runAll():
+            threads = [threading.Thread(target=runGroup, args=(group,), daemon=True) for group in groups]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if self.ready():
+                runGroup(after)
+
+        thread = threading.Thread(target=runAll, daemon=True)
+        thread.start()
+        return thread
+
+    #Records a state reached outside of run, like "unloaded"
+    def mark(self, name, state):
+        with self.lock:
+            self.components[name] = {'state': state}
+
+    #True when all the required components are loaded, or were unloaded and reload on demand
+    def ready(self):
+        with self.lock:
+            return all(component['state'] in ("ready", "unloaded") for name, component in self.components.items()
+                       if name not in self.optional)
+
+    def report(self):
+        ready = self.ready()
+        with self.lock:
+            return {
+                'ready': ready,
+                'uptime': time.time() - self.started,
+                'components': {name: dict(component) for name, component in self.components.items()}
+            }
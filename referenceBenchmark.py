@@ -0,0 +1,65 @@
+from encoder import inference as encoder
+import numpy as np
+import argparse
+import benchmark
+import audioIO
+import json
+import time
+
+#Compares the loading of long reference uploads: decoded at librosa's rate then resampled
+#again by the encoder (the previous path), against decoded straight at the encoder rate.
+#Only the preprocessing of the encoder is used, its model is not needed.
+
+#Previous path: two resampling passes
+def twoPasses(data, resampler):
+    start = time.perf_counter()
+    wav = audioIO.decodeAudio(data, audioIO.referenceRate)
+    decoded = time.perf_counter()
+    wav = encoder.preprocess_wav(wav, audioIO.referenceRate)
+    return wav, decoded - start, time.perf_counter() - decoded
+
+#Current path: resampled by ffmpeg while decoding
+def singlePass(data, resampler):
+    start = time.perf_counter()
+    wav = audioIO.decodeAudio(data, encoder.sampling_rate, resampler)
+    decoded = time.perf_counter()
+    wav = encoder.preprocess_wav(wav, encoder.sampling_rate)
+    return wav, decoded - start, time.perf_counter() - decoded
+
+#Median decode and preprocess seconds of 'load' over 'repeats' runs
+def measure(load, data, resampler, repeats):
+    runs = [load(data, resampler) for i in range(repeats)]
+    decode = float(np.median([run[1] for run in runs]))
+    preprocess = float(np.median([run[2] for run in runs]))
+    return {'decode': decode, 'preprocess': preprocess, 'total': decode + preprocess, 'samples': len(runs[0][0])}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the loading of reference audio uploads")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[30, 120, 600], help="upload durations")
+    parser.add_argument("--format", default="mp3")
+    parser.add_argument("--resamplers", nargs="+", default=["", "soxr"], help="ffmpeg resamplers, '' for the default one")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="reference_benchmark.json")
+    args = parser.parse_args()
+
+    report = {'format': args.format, 'encoderRate': encoder.sampling_rate, 'uploads': []}
+    for seconds in args.seconds:
+        data = benchmark.referenceAudio(audioIO, seconds, args.format)
+        result = {'seconds': seconds, 'bytes': len(data), 'twoPasses': measure(twoPasses, data, "", args.repeats)}
+        for resampler in args.resamplers:
+            name = "singlePass" + ("-" + resampler if resampler else "")
+            try:
+                result[name] = measure(singlePass, data, resampler, args.repeats)
+            except audioIO.AudioError as e:
+                print("Resampler", resampler, "unavailable:", e)
+                continue
+            result[name]['speedup'] = result['twoPasses']['total'] / result[name]['total']
+            print("%6.0fs upload  two passes %.3fs  %s %.3fs  x%.2f" % (
+                seconds, result['twoPasses']['total'], name, result[name]['total'], result[name]['speedup']))
+        report['uploads'].append(result)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
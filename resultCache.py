@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import json
+
+#Least recently used cache of encoded output audio, bounded by the total size of the entries.
+#Entries are keyed by the speaker embeds, the normalized text, the sampling
+#parameters and the output format.
+class ResultCache:
+    def __init__(self, maxBytes=256 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #Texts differing only by whitespace produce the same audio
+    @staticmethod
+    def normalizeText(text):
+        return " ".join(text.split())
+
+    @staticmethod
+    def keyFor(embed, text, params, format):
+        key = hashlib.sha256()
+        key.update(np.ascontiguousarray(embed, dtype=np.float32).tobytes())
+        key.update(ResultCache.normalizeText(text).encode("utf-8"))
+        key.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        key.update(format.encode("utf-8"))
+        return key.hexdigest()
+
+    #Returns the cached bytes for 'key' or None
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    #Stores 'data', evicting the least recently used entries until it fits
+    def put(self, key, data):
+        if len(data) > self.maxBytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.maxBytes:
+                evictedKey, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    #Returns the cached bytes for 'key', computing them with 'compute' on a miss
+    def getOrCompute(self, key, compute):
+        data = self.get(key)
+        if data is None:
+            data = compute()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'maxBytes': self.maxBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,116 @@
+from werkzeug.serving import make_server
+import serviceConfig
+import importlib
+import argparse
+import threading
+import socket
+import signal
+import time
+import sys
+import gc
+import os
+
+#Production serving: the models are loaded once, then worker processes are forked.
+#The workers share the weights copy-on-write (and through the page cache for
+#memory-mapped checkpoints), each one pinned to its own set of cores with torch
+#threads matching it, and serve from the same listening socket.
+
+#Splits the available cores into 'workers' contiguous sets
+def coreSets(workers):
+    cores = sorted(os.sched_getaffinity(0))
+    sets = []
+    for i in range(workers):
+        start = i * len(cores) // workers
+        end = (i + 1) * len(cores) // workers
+        sets.append(cores[start:end] or [cores[i % len(cores)]])
+    return sets
+
+#Body of a forked worker process
+def runWorker(service, listener, cores, host, port):
+    os.sched_setaffinity(0, cores)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(len(cores))
+
+    #the warm-up runs in the worker, so its thread pools and caches are its own
+    threading.Thread(target=lambda: service.readiness.run("warmup", service.warmup), daemon=True).start()
+
+    server = make_server(host, port, service.app, threaded=True, fd=listener.fileno())
+    print("Worker", os.getpid(), "serving on cores", cores)
+    server.serve_forever()
+
+#Forks a worker and returns its pid
+def forkWorker(service, listener, cores, host, port):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            runWorker(service, listener, cores, host, port)
+        finally:
+            os._exit(1)
+    return pid
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the voice cloning service with several worker processes")
+    parser.add_argument("--app", default="service", choices=["service", "serviceSV2TTS"])
+    parser.add_argument("--host", default=serviceConfig.host)
+    parser.add_argument("--port", type=int, default=serviceConfig.port)
+    parser.add_argument("--workers", type=int, default=serviceConfig.workers)
+    args = parser.parse_args()
+
+    if serviceConfig.device != "cpu":
+        #a cuda context does not survive fork, each process would need its own copy of the weights
+        sys.exit("The multi-process mode shares the weights in host memory, it requires VC_DEVICE=cpu")
+
+    #the SV2TTS models pick cuda by themselves when they see a gpu
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+    workers = args.workers or max(1, len(os.sched_getaffinity(0)) // 4)
+    cores = coreSets(workers)
+
+    service = importlib.import_module(args.app)
+    service.app.config["DEBUG"] = False
+
+    print("Loading the models once for", workers, "workers")
+    service.preload()
+    #objects loaded so far are never collected, so the collector does not dirty their shared pages
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(serviceConfig.backlog)
+
+    children = {}
+    for i in range(workers):
+        children[forkWorker(service, listener, cores[i], args.host, args.port)] = i
+
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    #workers that die are forked again from the loaded models
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        i = children.pop(pid, None)
+        if i is None or stopping:
+            continue
+        print("Worker", pid, "exited with status", status, ", restarting it")
+        time.sleep(1)
+        children[forkWorker(service, listener, cores[i], args.host, args.port)] = i
+
+if __name__ == "__main__":
+    main()
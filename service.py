@@ -1,26 +1,30 @@
 import flask
-from flask import request, jsonify, abort, send_from_directory
-from scipy.io import wavfile
-from encoder import inference as encoder
+from flask import request, jsonify, abort
+from speakerEncoder import SpeakerEncoder
+from embedCache import EmbedCache
+from voiceRegistry import VoiceRegistry
+from resultCache import ResultCache
+from jobs import JobQueue
+from readiness import Readiness
+from admission import Admission, Rejected
+from device import Device
 from pathlib import Path
+from concurrent import futures
+import streaming
+import metrics
+import backends
+import audioIO
+import serviceConfig
 import numpy as np
-import subprocess
-import threading
-import librosa
-import torch
+import functools
 import time
+import uuid
 import json
 import sys
 import os
 
 sys.path.insert(0, "flowtron")
-from flowtron import Flowtron
-from torch.utils.data import DataLoader
-from data import Data
-
-sys.path.insert(0, "flowtron/tacotron2")
-sys.path.insert(0, "flowtron/tacotron2/waveglow")
-from glow import WaveGlow
+from text import split_sentences
 
 
 app = flask.Flask(__name__)
@@ -28,15 +32,64 @@ app.config["DEBUG"] = True
 
 #Data paths
 examplePath = "audio/examples"
-dataPath = "audio/data"
+
+#Device of the speaker encoder and of the backends running on torch
+inferenceDevice = Device(serviceConfig.device, serviceConfig.precision,
+                         serviceConfig.cpuThreads, serviceConfig.cpuInteropThreads)
+
+#Synthesis backends, all sharing the speaker encoder, the caches and the request pipeline
+backends.create(serviceConfig.backends, inferenceDevice)
+
+#Speaker encoder module, encoder.inference imported by loadEncoder unless a stand-in was installed
+encoder = None
+
+#Speaker encoder batching the uploads of concurrent requests
+speakerEncoder = SpeakerEncoder(encoder, serviceConfig.encoderBatchMaxSize, serviceConfig.encoderBatchMaxWaitMs,
+                                serviceConfig.encoderMaxPartials)
+
+#Speaker embeds of the uploaded reference audio, keyed by content
+embedCache = EmbedCache(serviceConfig.embedCacheSize, serviceConfig.embedCacheDir)
+
+#Enrolled voices, synthesized by id without running the encoder
+voiceRegistry = VoiceRegistry(serviceConfig.voiceRegistryDir)
+
+#Admission control of the synthesis requests
+admission = Admission(serviceConfig.admissionMaxActive, serviceConfig.admissionMaxQueued,
+                      serviceConfig.admissionPerClient)
+
+#Encoded audio of recently synthesized texts, keyed by voice, text and parameters
+resultCache = ResultCache(serviceConfig.resultCacheBytes)
+
+#ffmpeg processes started ahead, for the formats libsndfile cannot encode and the reference uploads
+audioIO.ffmpegPool.spares = serviceConfig.ffmpegSpares
+audioIO.ffmpegPool.commands = serviceConfig.ffmpegSpareCommands
+
+#Asynchronous synthesis jobs, run by a fixed pool of workers sharing the models
+jobQueue = JobQueue(serviceConfig.jobWorkers, serviceConfig.jobResultTtl)
+
+#Components loaded at startup: the shared encoder and examples, then the components of every backend
+components = ["encoder", "examples"] + [backend.name + "/" + name for backend in backends.registry.values()
+                                        for name, load in backend.components()]
+
+#Loading state of the components, reported at /ready
+readiness = Readiness(components, optional=["warmup"])
+for backend in backends.registry.values():
+    backend.readiness = readiness
 
 #Create example embeds for an audio file
 def exampleEmbed(filename):
     in_fpath = examplePath + "/" + filename
-    original_wav, sampling_rate = librosa.load(Path(in_fpath))
-    preprocessed_wav = encoder.preprocess_wav(original_wav, sampling_rate)
+    #the embeds are saved next to the audio file, so later starts do not need to compute them
+    embedPath = os.path.splitext(in_fpath)[0] + ".npy"
+    if os.path.exists(embedPath) and os.path.getmtime(embedPath) >= os.path.getmtime(in_fpath):
+        return np.load(embedPath)
+    
+    with open(in_fpath, "rb") as f:
+        preprocessed_wav = loadReference(f.read())
     #getting the embeds from the encoder
-    return encoder.embed_utterance(preprocessed_wav)
+    embed = speakerEncoder.embed(preprocessed_wav)
+    np.save(embedPath, embed)
+    return embed
 
 #Create the example embeds
 def examplesSetup():
@@ -48,144 +101,218 @@ def examplesSetup():
     gordonRamsay = exampleEmbed("gordonRamsay.wav")
     stephenHawking = exampleEmbed("stephenHawking.wav")
 
+def loadEncoder():
+    global encoder
+    if encoder is None:
+        from encoder import inference
+        encoder = inference
+        speakerEncoder.encoder = encoder
+    encoder_weights = Path("encoder/saved_models/pretrained.pt")
+    encoder.load_model(encoder_weights, device=inferenceDevice.torch)
+
 #Initializes the components with pretrained weights
 def setup():
-    # Parse configs.  Globals nicer in this case
-    with open("flowtron/infer.json") as f:
-        data = f.read()
+    loadEncoder()
+    for backend in backends.registry.values():
+        backend.load()
 
-    global config
-    config = json.loads(data)
+#Runs a short synthesis on every backend, so the first request does not pay for the lazy initializations.
+#It goes through the batcher like the requests, which may already be served.
+def warmup():
+    for backend in backends.registry.values():
+        backend.synthesize("Warm up.", barackobama)
 
-    global data_config
-    data_config = config["data_config"]
-    global model_config
-    model_config = config["model_config"]
+#Groups of components loaded in order, independent of the other groups
+def componentLoaders():
+    groups = [[("encoder", loadEncoder), ("examples", examplesSetup)]]
+    for backend in backends.registry.values():
+        groups.append([(backend.name + "/" + name, load) for name, load in backend.components()])
+    return groups
 
-    torch.backends.cudnn.enabled = True
-    torch.backends.cudnn.benchmark = False
+#Loads the components in the background, independent ones in parallel, then warms them up
+def startup():
+    readiness.runInBackground(componentLoaders(), after=[("warmup", warmup)])
 
-    global flowtron
-    global waveglow
-    global trainset
-    
-    encoder_weights = Path("encoder/saved_models/pretrained.pt")
-    encoder.load_model(encoder_weights)
-
-    torch.manual_seed(1234)
-    torch.cuda.manual_seed(1234)
-
-    #Load waveglow
-    waveglow = torch.load("flowtron/tacotron2/waveglow/saved_models/waveglow_256channels_universal_v5.pt")['model'].cuda().eval()
-    waveglow.cuda().half()
-    for k in waveglow.convinv:
-        k.float()
-    waveglow.eval()
-    
-    #Load flowtron
-    flowtron = Flowtron(**model_config).cuda()
-    state_dict = torch.load("flowtron/saved_models/pretrained.pt", map_location='cpu')['model'].state_dict()
-    flowtron.load_state_dict(state_dict)
-    flowtron.eval()
-
-    ignore_keys = ['training_files', 'validation_files']
-    trainset = Data(
-        data_config['training_files'],
-        **dict((k, v) for k, v in data_config.items() if k not in ignore_keys))
-
-#Generate audio from embeds
-def audioFromEmbeds(filename, embed):
-    textPath = dataPath + "/" + filename + ".txt"
-    #reading the text file and prepare the text string for the synthesizer
-    textFile = open(textPath)
-    text = textFile.read().replace("\n", " ")
-    textFile.close()
-    
-    text = trainset.get_text(text).cuda()
-    embeds = trainset.get_embeds(embed).cuda()
-    text = text[None]
-    embeds = embeds[None]
-    
-    with torch.no_grad():
-        residual = torch.cuda.FloatTensor(1, 80, 400).normal_() * 0.5
-        mels, attentions = flowtron.infer(
-            residual, embeds, text, gate_threshold=0.5)
-
-    with torch.no_grad():
-        audio = waveglow.infer(mels.half(), sigma=0.8).float()
-
-    audio = audio.cpu().numpy()[0]
-    # normalize audio for now
-    audio = audio / np.abs(audio).max()
-    
-    return audio
-
-#Run the application on the 2 files sharing the name 'filename'
-def run_voiceCloning(filename):   
-    in_fpath = dataPath + "/" + filename
-    
-    #transforming mp3 into wav
-    subprocess.call(['ffmpeg', '-i', in_fpath + '.mp3',
-                   in_fpath + '.wav'])
-    time.sleep(5)
-    #running the encoder on the audio input
-    original_wav, sampling_rate = librosa.load(Path(in_fpath + '.wav'))
-    preprocessed_wav = encoder.preprocess_wav(original_wav, sampling_rate)
-    #getting the embeds from the encoder
-    embed = encoder.embed_utterance(preprocessed_wav)
+#Loads every component in the calling thread, before the serving processes are forked
+def preload():
+    for group in componentLoaders():
+        for name, load in group:
+            readiness.run(name, load)
+
+#Backend chosen by the 'backend' field of the request, the default one when there is none
+def requestBackend():
+    name = flask.request.values.get("backend", serviceConfig.defaultBackend)
+    backend = backends.get(name)
+    if backend is None:
+        abort(404, "Unknown backend " + name)
+    return backend
+
+#Generate audio from the text and the embeds with 'backend' (by default the configured one)
+def audioFromEmbeds(text, embed, backend=None):
+    if backend is None:
+        backend = backends.get(serviceConfig.defaultBackend)
+    #prepare the text string for the synthesizer
+    text = text.replace("\n", " ")
     
-    return audioFromEmbeds(filename, [embed])
+    #the request is synthesized together with the ones arriving at the same time
+    start = time.perf_counter()
+    try:
+        wav = backend.synthesize(text, embed, requestDeadline())
+    except futures.TimeoutError:
+        abort(504, "The deadline passed before the audio was synthesized")
+    recordSynthesis(backend, wav, start)
+    return wav
+
+#Deadline (a time.time()) of the request being served, None without one or outside of a request
+def requestDeadline():
+    if not flask.has_request_context():
+        return None
+    return flask.g.get("deadline")
+
+#Records the duration of audio synthesized by 'backend' since 'start' and its real-time factor
+def recordSynthesis(backend, wav, start):
+    seconds = len(wav) / backend.sampleRate
+    metrics.outputAudioSeconds.inc(seconds, backend=backend.name)
+    if seconds > 0:
+        metrics.realTimeFactor.observe((time.perf_counter() - start) / seconds, backend=backend.name)
+
+#Decodes reference audio straight into memory at the encoder rate, resampling it in the same pass,
+#then normalizes its volume and trims its long silences
+def loadReference(audioData):
+    with metrics.stage("decode"):
+        wav = audioIO.decodeAudio(audioData, encoder.sampling_rate, serviceConfig.referenceResampler)
+    metrics.inputAudioSeconds.inc(len(wav) / encoder.sampling_rate)
+    #the audio is already at the encoder rate, so the encoder does not resample it again
+    with metrics.stage("preprocess"):
+        return encoder.preprocess_wav(wav, encoder.sampling_rate)
 
-#Delete all uploaded files when using examples
-def cleanExample(delay, path):
-    time.sleep(delay)
-    print("Cleaning [START|Example]: " + path)
+#Embeds of the uploaded reference audio
+def referenceEmbed(audioData):
+    #computes the embeds of the uploaded audio, used only on a cache miss
+    def computeEmbed():
+        preprocessed_wav = loadReference(audioData)
+        embed = enrolledMatch(preprocessed_wav)
+        if embed is not None:
+            return embed
+        #getting the embeds from the encoder
+        with metrics.stage("embed"):
+            return speakerEncoder.embed(preprocessed_wav)
     
-    os.remove(dataPath + "/" + path + ".txt")
-    os.remove(dataPath + "/" + path + "_out.mp3")
-    os.remove(dataPath + "/" + path + "_out.wav")
+    #the same reference voice is uploaded many times, so the embeds are cached by content
+    return embedCache.getOrCompute(audioData, computeEmbed)
+
+#Embeds of the enrolled voice closest to the preprocessed audio when they are similar enough, or None.
+#Only the beginning of the audio is encoded to find it, the whole audio is encoded when there is no match.
+def enrolledMatch(preprocessed_wav):
+    probeSamples = int(serviceConfig.voiceProbeSeconds * encoder.sampling_rate)
+    if serviceConfig.voiceMatchThreshold > 1 or len(preprocessed_wav) <= probeSamples:
+        return None
+    if not voiceRegistry.stats()['voices']:
+        return None
     
-    print("Cleaning [END|SUCCESS>Example]: " + path)
+    with metrics.stage("probe"):
+        probe = speakerEncoder.embed(preprocessed_wav[:probeSamples])
+    voiceId, similarity = voiceRegistry.search(probe)
+    if voiceId is None or similarity < serviceConfig.voiceMatchThreshold:
+        return None
+    embed = voiceRegistry.get(voiceId)
+    if embed is not None:
+        metrics.voiceMatches.inc()
+    return embed
+
+#Run the application on the uploaded reference audio and text
+def run_voiceCloning(audioData, text, backend=None):
+    return audioFromEmbeds(text, referenceEmbed(audioData), backend)
+
+#Parameters the audio generated by 'backend' depends on, besides the text and the embeds
+def synthesisParams(backend):
+    params = dict(backend.params())
+    params['backend'] = backend.name
+    params['seed'] = serviceConfig.seed
+    return params
 
-#Delete all uploaded files to the service and the created auxiliary files by the service
-def clean(delay, path):
-    time.sleep(delay)
-    print("Cleaning [START]: " + path)
+#Output format asked for by the request: the 'format', 'rate' and 'bitrate' fields, or else the
+#first supported audio type of the Accept header, or else the configured one
+def requestFormat(backend):
+    values = flask.request.values
+    codec = values.get("format")
+    if codec is None:
+        accept = flask.request.accept_mimetypes
+        for mimeType, quality in accept:
+            codec = audioIO.acceptedTypes.get(mimeType.split(";")[0].strip().lower())
+            if codec is not None and quality > 0:
+                break
+            codec = None
+        if codec is None and accept and not accept.find("audio/*") >= 0 and not accept.find("*/*") >= 0:
+            abort(406, "Supported audio types: " + ", ".join(sorted(audioIO.acceptedTypes)))
     
-    os.remove(dataPath + "/" + path + ".txt")
-    os.remove(dataPath + "/" + path + ".mp3")
-    os.remove(dataPath + "/" + path + ".wav")
-    os.remove(dataPath + "/" + path + "_out.mp3")
-    os.remove(dataPath + "/" + path + "_out.wav")
+    try:
+        sampleRate = int(values["rate"]) if values.get("rate") else None
+        bitrate = int(values["bitrate"]) if values.get("bitrate") else None
+    except ValueError:
+        abort(400, "The rate (Hz) and the bitrate (kbps) must be integers")
+    try:
+        format = audioIO.OutputFormat(codec or serviceConfig.outputFormat, sampleRate, bitrate)
+    except ValueError as e:
+        abort(400, str(e))
+    if sampleRate is not None and not 8000 <= sampleRate <= backend.sampleRate:
+        abort(400, "The rate must be between 8000 and " + str(backend.sampleRate))
+    if bitrate is not None and not 6 <= bitrate <= 320:
+        abort(400, "The bitrate must be between 6 and 320 kbps")
+    return format
+
+#Returns 'text' spoken with 'embed' and encoded as 'format', from the result cache when possible
+def encodedAudio(text, embed, backend, format="mp3"):
+    format = audioIO.OutputFormat.of(format)
+    key = ResultCache.keyFor(embed, text, synthesisParams(backend), format.key())
     
-    print("Cleaning [END|SUCCESS]: " + path)
+    def compute():
+        wav = audioFromEmbeds(text, embed, backend)
+        return encodeOutput(wav, backend, format)
     
-#Example list page
-@app.route('/audio/example', methods=['GET'])
-def listExamples():
-    list = "<div><hr>"
-    list = list + "<p>Barack Obama example    : /audio/example/obama</p><hr>"
-    list = list + "<p>Gordon Ramsay example   : /audio/example/ramsay</p><hr>"
-    list = list + "<p>Stephen Hawking example : /audio/example/hawking</p><hr>"
-    return list + "</div>"
+    return resultCache.getOrCompute(key, compute)
 
-#Barack Obama Example
-@app.route('/audio/example/obama', methods=['POST'])
-def obama():
-    return examplePage(barackobama)
+#Encodes the audio synthesized by 'backend' as 'format'
+def encodeOutput(wav, backend, format):
+    with metrics.stage("encode", backend=backend.name, format=format.codec):
+        try:
+            data = audioIO.encodeAudio(wav, backend.sampleRate, format)
+        except audioIO.AudioError as e:
+            print("Encoding failed:", e)
+            abort(400, "The audio could not be encoded as " + format.codec + " at " + str(format.rate(backend.sampleRate)) + " Hz")
+    metrics.outputBytes.inc(len(data), format=format.codec)
+    return data
 
-#Gordon Ramsay Example
-@app.route('/audio/example/ramsay', methods=['POST'])
-def ramsay():
-    return examplePage(gordonRamsay)
+#Returns the encoded audio as an attachment named after the uploaded files
+def audioAttachment(data, filename, backend, format):
+    return flask.Response(data, mimetype=format.mimeType(backend.sampleRate), headers={
+        "Content-Disposition": "attachment; filename=" + filename + "_out." + format.extension,
+        "X-Encoded-Size": str(len(data))
+    })
+
+#Reads the text of an uploaded .txt file
+def readText(file):
+    try:
+        return file.read().decode("utf-8")
+    except UnicodeDecodeError:
+        abort(400, "The .txt file must be utf-8 encoded")
     
-#Stephen Hawking Example
-@app.route('/audio/example/hawking', methods=['POST'])
-def hawking():
-    return examplePage(stephenHawking)
+#Returns a response streaming the audio of 'text' sentence by sentence while it is generated
+def streamAudio(text, embed, filename, backend):
+    format = requestFormat(backend)
+    sentences = split_sentences(text.replace("\n", " "), serviceConfig.streamMaxSentenceLength)
+    if not sentences:
+        abort(400, "The .txt file is empty")
+    backend.ensureLoaded()
+    
+    #the sentences are synthesized one by one, batched with the other requests
+    chunks = streaming.streamSentences(sentences, lambda sentence: backend.submitAsync(sentence, embed),
+                                       backend.sampleRate, serviceConfig.streamCrossfadeMs, format)
+    return flask.Response(chunks, mimetype=format.mimeType(backend.sampleRate),
+                          headers={"Content-Disposition": "attachment; filename=" + filename + "_out." + format.extension})
 
-#Template for example post request page
-def examplePage(embed):
+#Returns the uploaded .txt file of the example pages and its name
+def uploadedText():
     files = flask.request.files.getlist("file")
     receivedFiles = ""
     #debuging: print the files received
@@ -197,33 +324,13 @@ def examplePage(embed):
     if len(files) != 1:
         print("More or less files received")
         abort(400, "The service requires a .txt file")
-        
-    file = files[0]
-    #file need to be outside directories.
-    if "/" in file.filename:
-        abort(400, "Subdirectories are not allowed")
-    else:
-        file.save(open(os.path.join(dataPath, file.filename), "wb"))
-    
-    filename = file.filename.split('.')[0]
-    #generating the audio file
-    wavfile.write(dataPath + "/" + filename + "_out.wav", data_config['sampling_rate'], audioFromEmbeds(filename, [embed]))
-    
-    #converting the audio file from .wav to .mp3
-    in_fpath = dataPath + "/" + filename + "_out"
-    subprocess.call(['ffmpeg', '-i', in_fpath + '.wav',
-                   in_fpath + '.mp3'])
     
-    #before returning the file, start a thread to delete the files.
-    clearer = threading.Thread(target=cleanExample, args=(10, filename))
-    clearer.start()
-    
-    #return the audio generated as an attachment
-    return send_from_directory(dataPath, filename + "_out.mp3", as_attachment=True) 
+    file = files[0]
+    with metrics.stage("upload"):
+        return readText(file), file.filename.split('.')[0]
 
-#The create page handling post requests
-@app.route('/audio/create', methods=['POST'])
-def post_file():
+#Returns the uploaded reference audio, the text and their shared name
+def uploadedFiles():
     files = flask.request.files.getlist("file")
     receivedFiles = ""
     #debuging: print the files received
@@ -242,27 +349,450 @@ def post_file():
         print("Files do not share the same name")
         abort(400, "All files must have the same name" + sharedFileName)
     
-    #files need to be outside directories.
-    for file in files:
-        if "/" in file.filename:
-            abort(400, "Subdirectories are not allowed")
-        else:
-            file.save(open(os.path.join(dataPath, file.filename), "wb"))
+    #the .txt file holds the text, the other one the reference audio
+    textFiles = [file for file in files if file.filename.lower().endswith(".txt")]
+    if len(textFiles) != 1:
+        abort(400, "The service requires a .mp3 and a .txt file")
+    textFile = textFiles[0]
+    audioFile = files[1] if textFile is files[0] else files[0]
     
-    #generating the audio file         
-    wavfile.write(dataPath + "/" + sharedFileName + "_out.wav", data_config['sampling_rate'], run_voiceCloning(sharedFileName))
+    with metrics.stage("upload"):
+        return audioFile.read(), readText(textFile), sharedFileName
+
+#Runs the view under admission control: the request waits for a free slot, or is rejected with
+#a 429 and a Retry-After header when the queue or the client's share is full. A client may send
+#its time budget in the X-Deadline-Ms header: the request is dropped when it passes before it
+#could run, or before its audio is synthesized. The slot is kept until the response is sent.
+def admitted(view):
+    @functools.wraps(view)
+    def admittedView(*args, **kwargs):
+        deadline = None
+        budget = request.headers.get("X-Deadline-Ms")
+        if budget is not None:
+            try:
+                deadline = time.time() + float(budget) / 1000
+            except ValueError:
+                abort(400, "X-Deadline-Ms must be a number of milliseconds")
+        
+        client = request.remote_addr
+        try:
+            started = admission.acquire(client, deadline)
+        except Rejected as e:
+            headers = {'Retry-After': str(e.retryAfter)} if e.retryAfter is not None else {}
+            return jsonify({'error': e.message}), e.status, headers
+        
+        flask.g.deadline = deadline
+        try:
+            response = flask.make_response(view(*args, **kwargs))
+        except BaseException:
+            admission.release(client, started)
+            raise
+        response.call_on_close(lambda: admission.release(client, started))
+        return response
+    return admittedView
+
+#Returns the texts of a bulk request, the uploaded reference audio (None when the voice is 'named') and their name.
+#The texts are the lines of the uploaded .txt files and the 'text' fields.
+def uploadedBulk(named):
+    files = flask.request.files.getlist("file")
+    textFiles = [file for file in files if file.filename.lower().endswith(".txt")]
+    audioFiles = [file for file in files if not file.filename.lower().endswith(".txt")]
+    if len(audioFiles) != (0 if named else 1):
+        abort(400, "The service requires one .mp3 or .wav file, or a 'voice' or 'example' field")
+    
+    with metrics.stage("upload"):
+        texts = []
+        for file in textFiles:
+            texts += readText(file).splitlines()
+        texts += flask.request.form.getlist("text")
+        audioData = audioFiles[0].read() if audioFiles else None
     
-    #converting the audio file from .wav to .mp3
-    in_fpath = dataPath + "/" + sharedFileName + "_out"
-    subprocess.call(['ffmpeg', '-i', in_fpath + '.wav',
-                   in_fpath + '.mp3'])
+    texts = [text.strip() for text in texts if text.strip()]
+    if not texts:
+        abort(400, "The service requires a .txt file or 'text' fields")
+    if len(texts) > serviceConfig.bulkMaxTexts:
+        abort(400, "At most " + str(serviceConfig.bulkMaxTexts) + " texts per request")
+    
+    namedFiles = audioFiles or textFiles
+    filename = namedFiles[0].filename.split('.')[0] if namedFiles else "bulk"
+    return texts, audioData, filename
+
+#Synthesizes 'texts' with 'embed' and yields the multipart response parts, each one as soon as it is ready.
+#The texts are submitted shortest first, so the batches gather texts of similar lengths, and at most
+#'bulkWindow' of them are synthesizing at once, so the other requests are not starved.
+def bulkParts(texts, embed, backend, filename, boundary, format):
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    params = synthesisParams(backend)
+    pending = {}
+    
+    def part(i, data):
+        return streaming.multipartPart(boundary, {
+            'Content-Type': format.mimeType(backend.sampleRate),
+            'Content-Disposition': 'attachment; filename="%s_%d_out.%s"' % (filename, i, format.extension),
+            'X-Item-Index': i
+        }, data)
+    
+    def errorPart(i, message):
+        return streaming.multipartPart(boundary, {
+            'Content-Type': "application/json",
+            'X-Item-Index': i
+        }, json.dumps({'index': i, 'error': message}).encode("utf-8"))
+    
+    try:
+        position = 0
+        while position < len(order) or pending:
+            while position < len(order) and len(pending) < serviceConfig.bulkWindow:
+                i = order[position]
+                position += 1
+                key = ResultCache.keyFor(embed, texts[i], params, format.key())
+                data = resultCache.get(key)
+                if data is not None:
+                    yield part(i, data)
+                    continue
+                pending[backend.submitAsync(texts[i], embed)] = (i, key, time.perf_counter())
+            if not pending:
+                continue
+            
+            done, waiting = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                i, key, start = pending.pop(future)
+                try:
+                    wav = backend.finish(future.result())
+                    recordSynthesis(backend, wav, start)
+                    data = encodeOutput(wav, backend, format)
+                except Exception as e:
+                    print("Bulk item", i, "failed:", e)
+                    yield errorPart(i, str(e))
+                    continue
+                resultCache.put(key, data)
+                yield part(i, data)
+        yield streaming.multipartEnd(boundary)
+    finally:
+        #the texts of a client that went away are not synthesized
+        for future in pending:
+            future.cancel()
+
+#Bulk synthesis: one reference voice, many texts, sent back as a multipart/mixed response
+#with one part per text, in the order they finish. The 'X-Item-Index' header of a part
+#is the index of its text; a text that failed gets a JSON part with the error.
+@app.route('/audio/bulk', methods=['POST'])
+@admitted
+def bulk():
+    backend = requestBackend()
+    embed = requestVoice()
+    texts, audioData, filename = uploadedBulk(embed is not None)
     
-    #before returning the file, start a thread to delete the files.
-    clearer = threading.Thread(target=clean, args=(10, sharedFileName))
-    clearer.start()
+    if embed is None:
+        #the embeds are computed once for all the texts
+        try:
+            embed = referenceEmbed(audioData)
+        except audioIO.AudioError as e:
+            print("Decoding failed:", e)
+            abort(400, "The audio file could not be decoded")
     
-    #return the audio generated as an attachment
-    return send_from_directory(dataPath, sharedFileName + "_out.mp3", as_attachment=True)
+    format = requestFormat(backend)
+    boundary = uuid.uuid4().hex
+    return flask.Response(bulkParts(texts, embed, backend, filename, boundary, format),
+                          mimetype="multipart/mixed; boundary=" + boundary,
+                          headers={'X-Item-Count': str(len(texts))})
+
+#Example list page
+@app.route('/audio/example', methods=['GET'])
+def listExamples():
+    list = "<div><hr>"
+    list = list + "<p>Barack Obama example    : /audio/example/obama</p><hr>"
+    list = list + "<p>Gordon Ramsay example   : /audio/example/ramsay</p><hr>"
+    list = list + "<p>Stephen Hawking example : /audio/example/hawking</p><hr>"
+    list = list + "<p>Streamed sentence by sentence : /audio/example/&lt;name&gt;/stream</p><hr>"
+    return list + "</div>"
+
+#Barack Obama Example
+@app.route('/audio/example/obama', methods=['POST'])
+@admitted
+def obama():
+    return examplePage(barackobama)
+
+#Gordon Ramsay Example
+@app.route('/audio/example/ramsay', methods=['POST'])
+@admitted
+def ramsay():
+    return examplePage(gordonRamsay)
+    
+#Stephen Hawking Example
+@app.route('/audio/example/hawking', methods=['POST'])
+@admitted
+def hawking():
+    return examplePage(stephenHawking)
+
+#Embeds of the example voices by name
+def exampleEmbeds():
+    return {
+        'obama': barackobama,
+        'ramsay': gordonRamsay,
+        'hawking': stephenHawking
+    }
+
+#Embeds of an enrolled voice
+def enrolledEmbed(voiceId):
+    embed = voiceRegistry.get(voiceId)
+    if embed is None:
+        abort(404, "Unknown voice " + voiceId)
+    return embed
+
+#Embeds of the voice chosen by the 'voice' (an enrolled voice id) or the 'example' field, None when there is none
+def requestVoice():
+    voiceId = flask.request.values.get("voice")
+    if voiceId is not None:
+        return enrolledEmbed(voiceId)
+    
+    example = flask.request.values.get("example")
+    if example is not None:
+        examples = exampleEmbeds()
+        if example not in examples:
+            abort(404, "Unknown example " + example)
+        return examples[example]
+    return None
+
+#Streaming version of the example pages
+@app.route('/audio/example/<name>/stream', methods=['POST'])
+@admitted
+def exampleStream(name):
+    examples = exampleEmbeds()
+    if name not in examples:
+        abort(404, "Unknown example " + name)
+    embed = examples[name]
+    
+    text, filename = uploadedText()
+    return streamAudio(text, embed, filename, requestBackend())
+
+#Template for example post request page
+def examplePage(embed):
+    backend = requestBackend()
+    format = requestFormat(backend)
+    text, filename = uploadedText()
+    
+    #generating the audio and returning it as an attachment
+    return audioAttachment(encodedAudio(text, embed, backend, format), filename, backend, format)
+
+#The create page handling post requests
+@app.route('/audio/create', methods=['POST'])
+@admitted
+def post_file():
+    backend = requestBackend()
+    format = requestFormat(backend)
+    audioData, text, sharedFileName = uploadedFiles()
+    
+    try:
+        embed = referenceEmbed(audioData)
+    except audioIO.AudioError as e:
+        print("Decoding failed:", e)
+        abort(400, "The audio file could not be decoded")
+    
+    #generating the audio file and returning it as an attachment
+    return audioAttachment(encodedAudio(text, embed, backend, format), sharedFileName, backend, format)
+
+#The streaming version of the create page, the audio is sent sentence by sentence
+@app.route('/audio/stream', methods=['POST'])
+@admitted
+def stream_file():
+    backend = requestBackend()
+    audioData, text, sharedFileName = uploadedFiles()
+    
+    #the embeds are computed before streaming, so decoding errors are still reported
+    try:
+        embed = referenceEmbed(audioData)
+    except audioIO.AudioError as e:
+        print("Decoding failed:", e)
+        abort(400, "The audio file could not be decoded")
+    
+    return streamAudio(text, embed, sharedFileName, backend)
+
+#Queues a synthesis job and returns its id right away.
+#Posting a .mp3 and a .txt file clones the uploaded voice, posting a .txt file together
+#with a 'voice' or an 'example' field uses an enrolled voice or one of the example voices.
+@app.route('/audio/jobs', methods=['POST'])
+def createJob():
+    if jobQueue.pending.qsize() >= serviceConfig.jobMaxQueued:
+        return jsonify({'error': "Too many jobs waiting"}), 429, {'Retry-After': "10"}
+    backend = requestBackend()
+    format = requestFormat(backend)
+    embed = requestVoice()
+    if embed is None:
+        audioData, text, filename = uploadedFiles()
+        synthesize = lambda: encodedAudio(text, referenceEmbed(audioData), backend, format)
+    else:
+        text, filename = uploadedText()
+        synthesize = lambda: encodedAudio(text, embed, backend, format)
+    
+    #the worker generates the audio and encodes it
+    def run():
+        try:
+            return synthesize()
+        except audioIO.AudioError as e:
+            print("Decoding failed:", e)
+            raise ValueError("The audio file could not be decoded")
+    
+    job = jobQueue.submit(run, filename + "_out." + format.extension, format.mimeType(backend.sampleRate))
+    return jsonify(job.describe()), 202, {'Location': "/audio/jobs/" + job.id}
+
+#Status of a synthesis job
+@app.route('/audio/jobs/<jobId>', methods=['GET'])
+def jobStatus(jobId):
+    job = jobQueue.get(jobId)
+    if job is None:
+        abort(404, "Unknown or expired job")
+    return jsonify(job.describe()), 200
+
+#Audio generated by a finished synthesis job
+@app.route('/audio/jobs/<jobId>/result', methods=['GET'])
+def jobResult(jobId):
+    job = jobQueue.get(jobId)
+    if job is None:
+        abort(404, "Unknown or expired job")
+    if job.status != "done":
+        return jsonify(job.describe()), 409
+    return flask.Response(job.result, mimetype=job.mimeType, headers={
+        "Content-Disposition": "attachment; filename=" + job.filename,
+        "X-Encoded-Size": str(len(job.result))
+    })
+
+#Enrolls the uploaded reference audio as a voice and returns its id
+@app.route('/voices', methods=['POST'])
+@admitted
+def enrollVoice():
+    files = flask.request.files.getlist("file")
+    if len(files) != 1:
+        abort(400, "The service requires a .mp3 or .wav file")
+    with metrics.stage("upload"):
+        audioData = files[0].read()
+    
+    try:
+        embed = referenceEmbed(audioData)
+    except audioIO.AudioError as e:
+        print("Decoding failed:", e)
+        abort(400, "The audio file could not be decoded")
+    
+    voiceId = voiceRegistry.enroll(embed, flask.request.values.get("name", files[0].filename.split('.')[0]))
+    return jsonify(voiceRegistry.describe(voiceId)), 201, {'Location': "/voices/" + voiceId}
+
+#Enrolled voices
+@app.route('/voices', methods=['GET'])
+def listVoices():
+    return jsonify({'voices': voiceRegistry.list(), 'stats': voiceRegistry.stats()}), 200
+
+@app.route('/voices/<voiceId>', methods=['GET'])
+def voiceInfo(voiceId):
+    voice = voiceRegistry.describe(voiceId)
+    if voice is None:
+        abort(404, "Unknown voice " + voiceId)
+    return jsonify(voice), 200
+
+@app.route('/voices/<voiceId>', methods=['DELETE'])
+def deleteVoice(voiceId):
+    if not voiceRegistry.remove(voiceId):
+        abort(404, "Unknown voice " + voiceId)
+    return "", 204
+
+#Speaks the uploaded .txt file with an enrolled voice, without running the encoder
+@app.route('/voices/<voiceId>/audio', methods=['POST'])
+@admitted
+def voiceAudio(voiceId):
+    return examplePage(enrolledEmbed(voiceId))
+
+#Streaming version of the enrolled voice page
+@app.route('/voices/<voiceId>/stream', methods=['POST'])
+@admitted
+def voiceStream(voiceId):
+    embed = enrolledEmbed(voiceId)
+    text, filename = uploadedText()
+    return streamAudio(text, embed, filename, requestBackend())
+
+#Page that reports the state of the admission control
+@app.route("/admission", methods=["GET"])
+def admissionStats():
+    return jsonify(admission.stats()), 200
+
+#Page that reports the usage of the embeds and results caches
+@app.route("/audio/cache", methods=["GET"])
+def cacheStats():
+    return jsonify({'embeds': embedCache.stats(), 'results': resultCache.stats()}), 200
+
+#Page that reports the number of jobs by status
+@app.route("/audio/jobs", methods=["GET"])
+def jobStats():
+    return jsonify(jobQueue.stats()), 200
+
+#Page that reports the state of the synthesis backends
+@app.route("/backends", methods=["GET"])
+def backendStats():
+    return jsonify({
+        'default': serviceConfig.defaultBackend,
+        'backends': {name: backend.describe() for name, backend in backends.registry.items()}
+    }), 200
+
+#Readiness page: 200 once all the components are loaded, 503 before
+@app.route("/ready", methods=["GET"])
+def ready():
+    report = readiness.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+#Requests needing the models are refused until they are loaded
+@app.before_request
+def checkReady():
+    if request.method == "POST" and not readiness.ready():
+        return jsonify(readiness.report()), 503, {'Retry-After': "5"}
+
+#Counts the request as in flight and starts timing it
+@app.before_request
+def startRequest():
+    flask.g.start = time.perf_counter()
+    metrics.inFlight.inc()
+
+#Records the latency and the status of the request
+@app.after_request
+def recordRequest(response):
+    endpoint = request.endpoint or "unknown"
+    metrics.requests.inc(endpoint=endpoint, status=response.status_code)
+    if "start" in flask.g:
+        metrics.requestSeconds.observe(time.perf_counter() - flask.g.start, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def endRequest(error):
+    if "start" in flask.g:
+        metrics.inFlight.dec()
+
+#Requests waiting for a batch of each backend and jobs waiting for a worker
+def queueDepths():
+    depths = {(('queue', "batch"), ('backend', name)): backend.batcher.depth()
+              for name, backend in backends.registry.items()}
+    for name, backend in backends.registry.items():
+        for stage, depth in backend.pipeline.depths().items():
+            depths[(('queue', stage), ('backend', name))] = depth
+    depths[(('queue', "jobs"), ('backend', ""))] = jobQueue.pending.qsize()
+    depths[(('queue', "encoder"), ('backend', ""))] = speakerEncoder.depth()
+    return depths
+
+metrics.Gauge("vc_queue_depth", "Requests waiting in the queues", queueDepths)
+
+#Busy fraction of the workers of every pipeline stage since they started
+def pipelineUtilization():
+    return {(('pipeline', name), ('stage', stage)): stats['utilization']
+            for name, backend in backends.registry.items() for stage, stats in backend.pipeline.stats().items()}
+
+metrics.Gauge("vc_pipeline_utilization", "Busy fraction of the workers of each pipeline stage", pipelineUtilization)
+
+#Requests running and waiting under admission control
+def admissionStates():
+    stats = admission.stats()
+    return {(('state', "active"),): stats['active'], (('state', "waiting"),): stats['waiting']}
+
+metrics.Gauge("vc_admission_requests", "Synthesis requests running and waiting for a slot", admissionStates)
+
+#Metrics in the Prometheus text format
+@app.route("/metrics", methods=["GET"])
+def metricsPage():
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 #Page that returns the ip or local ip of the device.
 @app.route("/ip", methods=["GET"])
@@ -280,12 +810,20 @@ def home():
     homepage = homepage + "<p>This service creates a audio file which contains a spoken text using a given voice</p>"
     homepage = homepage + "<p>To make such a file, post an .mp3 or .wav and a .txt file to /audio/create, and make sure they share filenames.</p>"
     homepage = homepage + "<p>You will receive the created file as an attachment in a couple of seconds later.</p>"
-    homepage = homepage + "<p>All data is deleted when the creation process is finished, this is a stateless service.</p>"
+    homepage = homepage + "<p>Add a 'backend' field to choose the synthesis backend: " + ", ".join(backends.registry) + ".</p>"
+    homepage = homepage + "<p>Post the same files to /audio/jobs to queue the creation, then poll /audio/jobs/&lt;id&gt; until the result is ready.</p>"
+    homepage = homepage + "<p>Post the same files to /audio/stream to receive the audio sentence by sentence while it is created.</p>"
+    homepage = homepage + "<p>Post a voice to /voices to enroll it, then post .txt files to /voices/&lt;id&gt;/audio to use it without uploading it again.</p>"
+    homepage = homepage + "<p>Post one voice and a .txt file with one text per line to /audio/bulk to receive every line as a part of a multipart response.</p>"
+    homepage = homepage + "<p>The audio is sent as mp3 by default. Ask for another format with the Accept header or a 'format' field (mp3, opus, flac, wav or pcm), a lower sample rate with a 'rate' field and a bitrate (kbps) with a 'bitrate' field.</p>"
+    homepage = homepage + "<p>Busy servers answer 429 with a Retry-After header; send an X-Deadline-Ms header to drop requests that could not be served in time.</p>"
+    homepage = homepage + "<p>All data is deleted when the creation process is finished, this is a stateless service. Only the voices you enroll are kept, until you delete them.</p>"
+    if serviceConfig.embedCacheDir:
+        homepage = homepage + "<p>This server keeps the speaker embeddings of the uploaded voices to serve them again faster.</p>"
 	
     return homepage + "</div>";
 
 #MAIN    	
 if __name__ == "__main__":
-    setup()
-    examplesSetup()
+    startup()
     app.run(host='192.168.0.112')
@@ -0,0 +1,135 @@
+import os
+
+#Service settings, overridable through environment variables
+
+#Speaker embedding cache: number of embeddings kept in memory and the directory used to
+#persist them between restarts. The disk tier keeps the embeds of the uploads and is never
+#evicted, so it is off ("") by default
+embedCacheSize = int(os.environ.get("VC_EMBED_CACHE_SIZE", "256"))
+embedCacheDir = os.environ.get("VC_EMBED_CACHE_DIR", "")
+
+#ffmpeg resampler of the uploaded reference audio, decoded straight at the encoder rate:
+#"" for ffmpeg's default one, "soxr" when ffmpeg is built with it
+referenceResampler = os.environ.get("VC_REFERENCE_RESAMPLER", "")
+
+#Voice registry: directory of the enrolled voices, and the cosine similarity above which an
+#uploaded voice reuses the embed of the closest enrolled one, compared on the embed of its
+#first 'voiceProbeSeconds' seconds. The matching serves an upload with a voice enrolled by
+#another client and costs an extra encoder pass per upload, so it is off by default (a threshold
+#above 1 disables it); set e.g. 0.95 to enable it
+voiceRegistryDir = os.environ.get("VC_VOICE_REGISTRY_DIR", "audio/voices")
+voiceMatchThreshold = float(os.environ.get("VC_VOICE_MATCH_THRESHOLD", "2"))
+voiceProbeSeconds = float(os.environ.get("VC_VOICE_PROBE_SECONDS", "2"))
+
+#Cross request batching of the synthesis models: the largest batch and the
+#longest time (ms) a request waits for others to join its batch
+batchMaxSize = int(os.environ.get("VC_BATCH_MAX_SIZE", "8"))
+batchMaxWaitMs = float(os.environ.get("VC_BATCH_MAX_WAIT_MS", "20"))
+
+#Pipelined synthesis: the batches go through the stages of their backend (frontend, acoustic and
+#vocoder for flowtron, acoustic and vocoder for sv2tts), each run by its own workers, so a batch is
+#in the acoustic model while the previous one is in the vocoder. The workers of a stage are set as
+#"stage=workers,..." (1 by default, the flowtron acoustic stage always has one), and at most
+#'pipelineQueueSize' batches wait in front of a stage
+pipelined = os.environ.get("VC_PIPELINED", "1").lower() in ("1", "true", "yes")
+pipelineWorkers = dict((stage.strip(), int(workers)) for stage, workers in
+                       (item.split("=") for item in os.environ.get("VC_PIPELINE_WORKERS", "").split(",") if item.strip()))
+pipelineQueueSize = int(os.environ.get("VC_PIPELINE_QUEUE_SIZE", "2"))
+
+#Cross request batching of the speaker encoder: the most uploads encoded together, the longest
+#time (ms) an upload waits for others and the most partial utterances of one forward pass
+encoderBatchMaxSize = int(os.environ.get("VC_ENCODER_BATCH_MAX_SIZE", "16"))
+encoderBatchMaxWaitMs = float(os.environ.get("VC_ENCODER_BATCH_MAX_WAIT_MS", "5"))
+encoderMaxPartials = int(os.environ.get("VC_ENCODER_MAX_PARTIALS", "64"))
+
+#Output audio: the format of the requests asking for none (mp3, opus, flac, wav or pcm),
+#how many ffmpeg processes are started ahead for every command line (0 starts them on demand)
+#and for how many of the most recently used command lines (each rate and bitrate has its own)
+outputFormat = os.environ.get("VC_OUTPUT_FORMAT", "mp3")
+ffmpegSpares = int(os.environ.get("VC_FFMPEG_SPARES", "2"))
+ffmpegSpareCommands = int(os.environ.get("VC_FFMPEG_SPARE_COMMANDS", "4"))
+
+#Streaming synthesis: longest piece of text synthesized at once (characters)
+#and the crossfade between consecutive pieces (ms)
+streamMaxSentenceLength = int(os.environ.get("VC_STREAM_MAX_SENTENCE_LENGTH", "200"))
+streamCrossfadeMs = float(os.environ.get("VC_STREAM_CROSSFADE_MS", "30"))
+
+#Bulk synthesis: the most texts of a request and how many of them are synthesizing at once
+bulkMaxTexts = int(os.environ.get("VC_BULK_MAX_TEXTS", "1000"))
+bulkWindow = int(os.environ.get("VC_BULK_WINDOW", str(2 * batchMaxSize)))
+
+#Asynchronous jobs: number of inference workers, how long (s) finished results are kept
+#and how many jobs may wait for a worker
+jobWorkers = int(os.environ.get("VC_JOB_WORKERS", "2"))
+jobResultTtl = float(os.environ.get("VC_JOB_RESULT_TTL", "600"))
+jobMaxQueued = int(os.environ.get("VC_JOB_MAX_QUEUED", "256"))
+
+#Admission control of the synthesis requests: how many run at once, how many more may wait
+#for them (the others get a 429 right away) and how many a client may have running or waiting
+admissionMaxActive = int(os.environ.get("VC_ADMISSION_MAX_ACTIVE", str(2 * batchMaxSize)))
+admissionMaxQueued = int(os.environ.get("VC_ADMISSION_MAX_QUEUED", "32"))
+admissionPerClient = int(os.environ.get("VC_ADMISSION_PER_CLIENT", "4"))
+
+#Cache of encoded output audio, bounded by its total size in bytes
+resultCacheBytes = int(os.environ.get("VC_RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+#Sampling parameters of the Flowtron backend: the deviation of the residual noise,
+#the gate threshold ending the decoding, WaveGlow's sigma and the random seed
+flowtronSigma = float(os.environ.get("VC_FLOWTRON_SIGMA", "0.5"))
+flowtronGateThreshold = float(os.environ.get("VC_FLOWTRON_GATE_THRESHOLD", "0.5"))
+waveglowSigma = float(os.environ.get("VC_WAVEGLOW_SIGMA", "0.8"))
+seed = int(os.environ.get("VC_SEED", "1234"))
+
+#Length of the Flowtron residual, the most frames decoded for a text: its symbols times
+#the speaking rate of the voice (frames per symbol), learned from the finished requests.
+#Until the rate is known, the default rate with headroom is used. A text reaching the
+#residual's end is decoded again with a residual twice as long, up to the largest one.
+flowtronFramesPerSymbol = float(os.environ.get("VC_FLOWTRON_FRAMES_PER_SYMBOL", "6"))
+flowtronRateHeadroom = float(os.environ.get("VC_FLOWTRON_RATE_HEADROOM", "1.5"))
+flowtronMinFrames = int(os.environ.get("VC_FLOWTRON_MIN_FRAMES", "40"))
+flowtronMaxFrames = int(os.environ.get("VC_FLOWTRON_MAX_FRAMES", "2000"))
+
+#Chunked vocoding: the mel spectrograms are vocoded in windows of 'vocoderChunkFrames' frames
+#overlapping by 'vocoderOverlapFrames', crossfaded back together (0, the default, vocodes them whole).
+#A vocoder pass never holds more than 'vocoderMaxFrames' frames, bounding its memory.
+#WaveRNN folds every window into segments of 'wavernnTarget' samples overlapping by 'wavernnOverlap'.
+vocoderChunkFrames = int(os.environ.get("VC_VOCODER_CHUNK_FRAMES", "0"))
+vocoderOverlapFrames = int(os.environ.get("VC_VOCODER_OVERLAP_FRAMES", "16"))
+vocoderMaxFrames = int(os.environ.get("VC_VOCODER_MAX_FRAMES", "2048"))
+wavernnTarget = int(os.environ.get("VC_WAVERNN_TARGET", "8000"))
+wavernnOverlap = int(os.environ.get("VC_WAVERNN_OVERLAP", "800"))
+
+#Compiled mode: WaveGlow runs as a TorchScript graph saved next to its checkpoint, used when
+#its output stays within 'compiledTolerance' (relative to the peak) of the eager one
+compiled = os.environ.get("VC_COMPILED", "0").lower() in ("1", "true", "yes")
+compiledTolerance = float(os.environ.get("VC_COMPILED_TOLERANCE", "0.01"))
+
+#Device the models run on ("cuda" or "cpu") and their precision: "fp16" (cuda only,
+#WaveGlow in half precision as before), "fp32", "bf16" (autocast) or "int8"
+#(cpu only, dynamic quantization of the linear and recurrent layers: Flowtron's, the convolutional
+#WaveGlow stays in fp32).
+#The thread counts only apply on cpu, 0 keeps torch's defaults.
+device = os.environ.get("VC_DEVICE", "cuda")
+precision = os.environ.get("VC_PRECISION", "fp16" if device == "cuda" else "fp32")
+cpuThreads = int(os.environ.get("VC_CPU_THREADS", "0"))
+cpuInteropThreads = int(os.environ.get("VC_CPU_INTEROP_THREADS", "0"))
+
+#Production serving (serve.py): address, number of worker processes (0 picks one
+#per 4 cores) and the listen backlog
+host = os.environ.get("VC_HOST", "192.168.0.112")
+port = int(os.environ.get("VC_PORT", "5000"))
+workers = int(os.environ.get("VC_WORKERS", "0"))
+backlog = int(os.environ.get("VC_BACKLOG", "128"))
+
+#Synthesis backends served by the engine, the first one is used when a request
+#does not choose one. Backends idle for backendIdleSeconds are unloaded when the
+#available memory falls below memoryLowFraction, checked every memoryCheckSeconds.
+backends = [name.strip() for name in os.environ.get("VC_BACKENDS", "flowtron").split(",") if name.strip()]
+defaultBackend = backends[0]
+backendIdleSeconds = float(os.environ.get("VC_BACKEND_IDLE_SECONDS", "300"))
+memoryLowFraction = float(os.environ.get("VC_MEMORY_LOW_FRACTION", "0.1"))
+memoryCheckSeconds = float(os.environ.get("VC_MEMORY_CHECK_SECONDS", "10"))
+
+#Stub backend (VC_BACKENDS=stub), without models: how long it takes relative to the
+#duration of the audio it makes (0 answers right away)
+stubRealTimeFactor = float(os.environ.get("VC_STUB_REAL_TIME_FACTOR", "0"))
@@ -0,0 +1,45 @@
+from batcher import Batcher
+import numpy as np
+import metrics
+
+#Speaker encoder shared by the concurrent requests. Each request cuts its audio into partial
+#utterances and computes their mel frames in its own thread; the partials of all the waiting
+#requests then go through the encoder together, at most 'maxPartials' per forward pass.
+#The partial embeds are averaged back per request and L2 normalized, like embed_utterance does.
+class SpeakerEncoder:
+    def __init__(self, encoder, maxBatchSize=16, maxWaitMs=5, maxPartials=64):
+        self.encoder = encoder
+        self.maxPartials = max(1, maxPartials)
+        self.batcher = Batcher(self.embedBatch, maxBatchSize, maxWaitMs)
+
+    #Mel frames of the partial utterances of a preprocessed wav, (partials, frames, channels)
+    def partials(self, wav):
+        wavSlices, melSlices = self.encoder.compute_partial_slices(len(wav))
+        length = wavSlices[-1].stop
+        if length >= len(wav):
+            wav = np.pad(wav, (0, length - len(wav)), "constant")
+        frames = self.encoder.audio.wav_to_mel_spectrogram(wav)
+        return np.array([frames[s] for s in melSlices])
+
+    #Embeds of the partials of several requests, run in passes of at most 'maxPartials' partials
+    def embedBatch(self, partialsList):
+        frames = np.concatenate(partialsList)
+        with metrics.stage("encoder"):
+            partialEmbeds = np.concatenate([self.encoder.embed_frames_batch(frames[i:i + self.maxPartials])
+                                            for i in range(0, len(frames), self.maxPartials)])
+
+        embeds = []
+        start = 0
+        for partials in partialsList:
+            embed = partialEmbeds[start:start + len(partials)].mean(axis=0)
+            embeds.append(embed / np.linalg.norm(embed, 2))
+            start += len(partials)
+        return embeds
+
+    #Embed of a preprocessed wav, computed together with the other waiting requests
+    def embed(self, wav):
+        return self.batcher.submit(self.partials(wav))
+
+    #Number of requests waiting for the encoder
+    def depth(self):
+        return self.batcher.depth()
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import math
+
+#Running statistics (Welford) of the mel frames generated per text symbol
+class RateStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def describe(self):
+        return {'count': self.count, 'mean': self.mean, 'std': self.std}
+
+#Speaking rate of every voice, used to size the decoder residual of a text.
+#Until a voice has 'minSamples' observations, the rate of all the voices is used,
+#and before that the 'default' rate with 'headroom'. Once known, a rate is bounded
+#by its mean plus 'deviations' standard deviations, so the estimate tightens over time.
+class SpeakingRates:
+    def __init__(self, default=6.0, headroom=1.5, deviations=3.0, minSamples=3, maxVoices=1024):
+        self.default = default
+        self.headroom = headroom
+        self.deviations = deviations
+        self.minSamples = minSamples
+        self.maxVoices = maxVoices
+        self.voices = OrderedDict()
+        self.overall = RateStats()
+        self.lock = threading.Lock()
+
+    #Key of a speaker embed
+    @staticmethod
+    def keyFor(embed):
+        return hashlib.sha1(np.ascontiguousarray(embed).tobytes()).hexdigest()
+
+    def bound(self, stats):
+        return stats.mean + self.deviations * stats.std
+
+    #Upper estimate of the frames per symbol of the voice 'key'
+    def rate(self, key):
+        with self.lock:
+            stats = self.voices.get(key)
+            if stats is not None and stats.count >= self.minSamples:
+                return self.bound(stats)
+            if self.overall.count >= self.minSamples:
+                return self.bound(self.overall)
+        return self.default * self.headroom
+
+    #Records that the voice 'key' spoke 'symbols' symbols in 'frames' frames
+    def observe(self, key, symbols, frames):
+        if symbols <= 0:
+            return
+        with self.lock:
+            stats = self.voices.get(key)
+            if stats is None:
+                stats = self.voices[key] = RateStats()
+            self.voices.move_to_end(key)
+            while len(self.voices) > self.maxVoices:
+                self.voices.popitem(last=False)
+            stats.add(frames / symbols)
+            self.overall.add(frames / symbols)
+
+    def stats(self):
+        with self.lock:
+            return {'voices': len(self.voices), 'overall': self.overall.describe()}
@@ -0,0 +1,57 @@
+import numpy as np
+import audioIO
+
+#Joins consecutive audio chunks with a linear crossfade of 'fadeSamples' samples.
+#The end of every chunk is held back until the next one arrives, so each
+#yielded piece can be played as soon as it is produced.
+def crossfade(chunks, fadeSamples):
+    tail = None
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if tail is not None:
+            n = min(len(tail), len(chunk))
+            if n:
+                ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+                chunk = chunk.copy()
+                chunk[:n] = tail[len(tail) - n:] * (1.0 - ramp) + chunk[:n] * ramp
+            #the part of the previous tail that did not overlap is played as is
+            yield tail[:len(tail) - n]
+        hold = min(fadeSamples, len(chunk) // 2)
+        yield chunk[:len(chunk) - hold]
+        tail = chunk[len(chunk) - hold:]
+    if tail is not None:
+        yield tail
+
+#Synthesizes the sentences one at a time and yields the encoded audio as soon as it is ready.
+#'synthesizeAsync' returns a future of the audio of a sentence; the next sentence is
+#started before the current one is encoded, so the models never wait for the client.
+#'format' is an audioIO.OutputFormat or a codec name.
+def streamSentences(sentences, synthesizeAsync, sampleRate, crossfadeMs, format="mp3"):
+    def chunks():
+        future = synthesizeAsync(sentences[0]) if sentences else None
+        for i in range(len(sentences)):
+            wav = future.result()
+            if i + 1 < len(sentences):
+                future = synthesizeAsync(sentences[i + 1])
+            yield wav
+
+    encoder = audioIO.StreamEncoder(sampleRate, format)
+    try:
+        for wav in crossfade(chunks(), int(sampleRate * crossfadeMs / 1000)):
+            data = encoder.write(wav)
+            if data:
+                yield data
+        data = encoder.finish()
+        if data:
+            yield data
+    finally:
+        encoder.close()
+
+#One part of a multipart response: the boundary line, the headers and the body
+def multipartPart(boundary, headers, body):
+    head = "--" + boundary + "\r\n" + "".join(name + ": " + str(value) + "\r\n" for name, value in headers.items())
+    return head.encode("utf-8") + b"\r\n" + body + b"\r\n"
+
+#Closing boundary of a multipart response
+def multipartEnd(boundary):
+    return ("--" + boundary + "--\r\n").encode("utf-8")
@@ -0,0 +1,142 @@
+from backends import Backend
+from types import SimpleNamespace
+import numpy as np
+import serviceConfig
+import metrics
+import time
+
+#Stand-in backend without models, for measuring the HTTP, I/O and scheduling overhead of the service.
+#It makes about 'framesPerSymbol' frames per character of text and a tone of one hop per frame, and
+#can hold each stage for a fraction of the duration of its audio to play a model of a given speed.
+class StubBackend(Backend):
+    name = "stub"
+    hopLength = 256
+    framesPerSymbol = 5
+
+    def __init__(self, device):
+        Backend.__init__(self, device)
+        self.loaded = False
+
+    @property
+    def sampleRate(self):
+        return 22050
+
+    def components(self):
+        return [("model", self.loadModel)]
+
+    def loadModel(self):
+        self.loaded = True
+
+    def isLoaded(self):
+        return self.loaded
+
+    def unloadModels(self):
+        self.loaded = False
+
+    def params(self):
+        return {'realTimeFactor': serviceConfig.stubRealTimeFactor}
+
+    def stages(self):
+        return [
+            ("acoustic", self.acoustic, None),
+            ("vocoder", self.vocoder, None)
+        ]
+
+    #Holds the stage for its share of the time a model of the configured speed would take on 'frames'
+    def hold(self, frames):
+        seconds = frames * self.hopLength / self.sampleRate
+        time.sleep(serviceConfig.stubRealTimeFactor * seconds / 2)
+
+    #Number of frames and pitch of every (text, embed) request
+    def acoustic(self, requests):
+        with metrics.stage("acoustic", backend=self.name):
+            frames = [max(1, len(text)) * self.framesPerSymbol for text, embed in requests]
+            pitches = [110 + 110 * abs(float(np.asarray(embed).reshape(-1)[0])) for text, embed in requests]
+            self.hold(sum(frames))
+        return frames, pitches
+
+    def vocoder(self, batch):
+        frames, pitches = batch
+        with metrics.stage("vocoder", backend=self.name):
+            wavs = []
+            for n, pitch in zip(frames, pitches):
+                t = np.arange(n * self.hopLength, dtype=np.float32) / self.sampleRate
+                wavs.append(0.5 * np.sin(2 * np.pi * pitch * t).astype(np.float32))
+            self.hold(sum(frames))
+        return wavs
+
+#Stand-in speaker encoder with the module interface of encoder.inference, in numpy only: log
+#spectral frames of 40 channels, a random projection to 'hidden' features averaged over each
+#partial utterance, and a projection to the embed. It runs without torch and the encoder package.
+class ProjectionEncoder:
+    sampling_rate = 16000
+    partials_n_frames = 160
+    window = 400
+    hop = 160
+
+    def __init__(self, hidden=256, embedSize=256):
+        random = np.random.RandomState(0)
+        self.filterbank = np.abs(random.randn(self.window // 2 + 1, 40)).astype(np.float32)
+        self.projection = (random.randn(40, hidden) / np.sqrt(40)).astype(np.float32)
+        self.output = (random.randn(hidden, embedSize) / np.sqrt(hidden)).astype(np.float32)
+        #the mel frames are computed by the 'audio' module of the encoder
+        self.audio = SimpleNamespace(wav_to_mel_spectrogram=self.wav_to_mel_spectrogram)
+
+    def load_model(self, weights_fpath=None, device=None):
+        pass
+
+    def is_loaded(self):
+        return True
+
+    #Resamples to the encoder rate and normalizes the volume
+    def preprocess_wav(self, fpath_or_wav, source_sr=None):
+        wav = np.asarray(fpath_or_wav, dtype=np.float32)
+        if source_sr is not None and source_sr != self.sampling_rate:
+            n = int(len(wav) * self.sampling_rate / source_sr)
+            wav = np.interp(np.arange(n) * source_sr / self.sampling_rate, np.arange(len(wav)), wav).astype(np.float32)
+        peak = np.abs(wav).max() if len(wav) else 0.0
+        return wav / peak if peak > 0 else wav
+
+    #Centered frames, one every 'hop' samples
+    def wav_to_mel_spectrogram(self, wav):
+        wav = np.pad(wav, self.window // 2, "reflect" if len(wav) > self.window // 2 else "constant")
+        starts = range(0, len(wav) - self.window + 1, self.hop)
+        frames = np.stack([wav[i:i + self.window] for i in starts]) * np.hanning(self.window)
+        return np.log(np.abs(np.fft.rfft(frames)).astype(np.float32) @ self.filterbank + 1e-6)
+
+    #Wav and mel slices of the partial utterances, as encoder.inference cuts them
+    def compute_partial_slices(self, n_samples, partial_utterance_n_frames=partials_n_frames,
+                               min_pad_coverage=0.75, overlap=0.5):
+        n_frames = int(np.ceil((n_samples + 1) / self.hop))
+        frame_step = max(int(np.round(partial_utterance_n_frames * (1 - overlap))), 1)
+        wav_slices, mel_slices = [], []
+        steps = max(1, n_frames - partial_utterance_n_frames + frame_step + 1)
+        for i in range(0, steps, frame_step):
+            mel_slices.append(slice(i, i + partial_utterance_n_frames))
+            wav_slices.append(slice(i * self.hop, (i + partial_utterance_n_frames) * self.hop))
+        last = wav_slices[-1]
+        coverage = (n_samples - last.start) / (last.stop - last.start)
+        if coverage < min_pad_coverage and len(mel_slices) > 1:
+            mel_slices = mel_slices[:-1]
+            wav_slices = wav_slices[:-1]
+        return wav_slices, mel_slices
+
+    #L2 normalized embeds of a batch of partial utterances (partials, frames, channels)
+    def embed_frames_batch(self, frames_batch):
+        features = np.tanh(np.asarray(frames_batch, dtype=np.float32) @ self.projection).mean(axis=1)
+        embeds = np.maximum(features @ self.output, 0)
+        return embeds / (np.linalg.norm(embeds, axis=1, keepdims=True) + 1e-5)
+
+    #L2 normalized embedding of an utterance, the average of its partial embeddings
+    def embed_utterance(self, wav, using_partials=True, return_partials=False, **kwargs):
+        wav_slices, mel_slices = self.compute_partial_slices(len(wav), **kwargs)
+        if wav_slices[-1].stop >= len(wav):
+            wav = np.pad(wav, (0, wav_slices[-1].stop - len(wav)), "constant")
+        frames = self.wav_to_mel_spectrogram(wav)
+        partial_embeds = self.embed_frames_batch(np.array([frames[s] for s in mel_slices]))
+
+        embed = partial_embeds.mean(axis=0)
+        embed = embed / np.linalg.norm(embed, 2)
+        if return_partials:
+            return embed, partial_embeds, wav_slices
+        return embed
@@ -0,0 +1,200 @@
+from types import SimpleNamespace
+from stubBackend import ProjectionEncoder
+import torch.nn.functional as F
+import torch.nn as nn
+import numpy as np
+import torch
+
+#Small random-weight stand-ins for the pretrained models, with the interfaces the service uses.
+#They run the same kind of computation (autoregressive decoding, flows, recurrent encoders)
+#at a reduced size, so the service can be benchmarked without checkpoints or a gpu.
+
+#Number of text symbols of the stand-ins
+nSymbols = 256
+
+#Gate of the stand-in decoders: the random weights are damped so every request ends
+#close to 'framesPerSymbol' frames per symbol of its text
+class Gate(nn.Module):
+    def __init__(self, hidden, framesPerSymbol):
+        nn.Module.__init__(self)
+        self.linear = nn.Linear(hidden, 1)
+        self.framesPerSymbol = framesPerSymbol
+
+    def forward(self, h, step, lengths):
+        target = (lengths.float() * self.framesPerSymbol)[:, None]
+        return 0.01 * self.linear(h).float() + (step + 1 - target)
+
+#Attention decoder with the inference interface of Flowtron
+class StubFlowtron(nn.Module):
+    def __init__(self, n_mel_channels=80, n_speaker_dim=256, hidden=256, framesPerSymbol=5):
+        nn.Module.__init__(self)
+        self.embedding = nn.Embedding(nSymbols, hidden)
+        self.speaker = nn.Linear(n_speaker_dim, hidden)
+        self.query = nn.Linear(hidden, hidden)
+        self.cell = nn.GRUCell(n_mel_channels + hidden, hidden)
+        self.projection = nn.Linear(hidden, n_mel_channels)
+        self.gate_layer = Gate(hidden, framesPerSymbol)
+
+    #Decodes until the gate of every request passes 'gate_threshold', at most one frame per residual frame.
+    #Like Flowtron, the attention has no text mask and attends to the padding of the shorter texts;
+    #the lengths only set when the stand-in gate closes.
+    def infer(self, residual, speaker_vecs, text, gate_threshold=0.5):
+        batchSize, nMels, maxFrames = residual.shape
+        lengths = (text != 0).sum(1)
+
+        memory = self.embedding(text % nSymbols)
+        #the speaker vectors are cut or padded to the size of the layer, whatever their layout
+        speaker_vecs = speaker_vecs.reshape(batchSize, -1).to(memory.dtype)
+        size = self.speaker.in_features
+        speaker_vecs = F.pad(speaker_vecs, (0, max(0, size - speaker_vecs.size(1))))[:, :size]
+        memory = memory + self.speaker(speaker_vecs)[:, None]
+        h = memory.new_zeros(batchSize, memory.size(2))
+        frame = memory.new_zeros(batchSize, nMels)
+
+        mels = []
+        attentions = []
+        for step in range(maxFrames):
+            scores = torch.bmm(memory, self.query(h)[:, :, None]).squeeze(2).float()
+            weights = torch.softmax(scores, dim=1).to(memory.dtype)
+            context = torch.bmm(weights[:, None], memory).squeeze(1)
+            h = self.cell(torch.cat([frame, context], 1).float(), h.float()).to(memory.dtype)
+            frame = self.projection(h) + residual[:, :, step].to(memory.dtype)
+            mels.append(frame)
+            attentions.append(weights)
+
+            gate = self.gate_layer(h, step, lengths)
+            if (torch.sigmoid(gate) > gate_threshold).all():
+                break
+
+        return torch.stack(mels, 2), torch.stack(attentions, 1)
+
+#Invertible 1x1 convolution of WaveGlow, with an orthogonal random weight
+class StubInvertibleConv(nn.Module):
+    def __init__(self, channels):
+        nn.Module.__init__(self)
+        self.conv = nn.Conv1d(channels, channels, kernel_size=1, bias=False)
+        W = torch.linalg.qr(torch.randn(channels, channels))[0]
+        self.conv.weight.data = W[..., None]
+
+#Coupling network of WaveGlow: gated dilated convolutions conditioned on the spectrogram
+class StubWN(nn.Module):
+    def __init__(self, n_in_channels, n_mel_channels, n_layers=4, n_channels=64, kernel_size=3):
+        nn.Module.__init__(self)
+        self.start = nn.Conv1d(n_in_channels, n_channels, 1)
+        self.cond = nn.Conv1d(n_mel_channels, 2 * n_channels * n_layers, 1)
+        self.layers = nn.ModuleList(
+            nn.Conv1d(n_channels, 2 * n_channels, kernel_size, dilation=2 ** i, padding=2 ** i * (kernel_size - 1) // 2)
+            for i in range(n_layers))
+        self.end = nn.Conv1d(n_channels, 2 * n_in_channels, 1)
+        #small outputs keep the inverse flows stable
+        self.end.weight.data.normal_(0, 0.01)
+        self.end.bias.data.zero_()
+        self.n_channels = n_channels
+
+    def forward(self, forward_input):
+        audio, spect = forward_input
+        audio = self.start(audio)
+        cond = self.cond(spect)
+        for i, layer in enumerate(self.layers):
+            acts = layer(audio) + cond[:, i * 2 * self.n_channels:(i + 1) * 2 * self.n_channels]
+            acts = torch.tanh(acts[:, :self.n_channels]) * torch.sigmoid(acts[:, self.n_channels:])
+            audio = audio + acts
+        return self.end(audio)
+
+#Flow vocoder with the layout of WaveGlow, run by waveglowInfer.infer
+class StubWaveGlow(nn.Module):
+    def __init__(self, n_mel_channels=80, n_flows=4, n_group=8, n_early_every=2, n_early_size=2,
+                 hop_length=256, n_layers=4, n_channels=64):
+        nn.Module.__init__(self)
+        self.upsample = nn.ConvTranspose1d(n_mel_channels, n_mel_channels, hop_length * 4, stride=hop_length)
+        self.n_flows = n_flows
+        self.n_group = n_group
+        self.n_early_every = n_early_every
+        self.n_early_size = n_early_size
+        self.WN = nn.ModuleList()
+        self.convinv = nn.ModuleList()
+
+        n_half = n_group // 2
+        n_remaining_channels = n_group
+        for k in range(n_flows):
+            if k % n_early_every == 0 and k > 0:
+                n_half = n_half - n_early_size // 2
+                n_remaining_channels = n_remaining_channels - n_early_size
+            self.convinv.append(StubInvertibleConv(n_remaining_channels))
+            self.WN.append(StubWN(n_half, n_mel_channels * n_group, n_layers, n_channels))
+        self.n_remaining_channels = n_remaining_channels
+
+#Tacotron like synthesizer with the interface of synthesizer.inference.Synthesizer
+class StubSynthesizer:
+    sample_rate = 16000
+    hparams = SimpleNamespace(sample_rate=16000, hop_size=200)
+
+    def __init__(self, hidden=256, framesPerSymbol=4, maxFrames=1000):
+        self.model = StubFlowtron(hidden=hidden, framesPerSymbol=framesPerSymbol).eval()
+        self.maxFrames = maxFrames
+
+    #One mel spectrogram (n_mels, frames) per text, trimmed to the end of its text
+    def synthesize_spectrograms(self, texts, embeddings, return_alignments=False):
+        sequences = [[ord(c) % (nSymbols - 1) + 1 for c in text] or [1] for text in texts]
+        text = torch.zeros(len(sequences), max(len(s) for s in sequences), dtype=torch.long)
+        for i, sequence in enumerate(sequences):
+            text[i, :len(sequence)] = torch.tensor(sequence)
+        embeds = torch.from_numpy(np.stack(embeddings)).float()
+
+        with torch.no_grad():
+            mels, alignments = self.model.infer(torch.zeros(len(texts), 80, self.maxFrames), embeds, text)
+        framesPerSymbol = self.model.gate_layer.framesPerSymbol
+        specs = [mels[i, :, :len(s) * framesPerSymbol].numpy() for i, s in enumerate(sequences)]
+        if return_alignments:
+            return specs, alignments
+        return specs
+
+#Recurrent vocoder with the module interface of vocoder.inference (WaveRNN)
+class StubVocoder:
+    def __init__(self, hop_size=200, hidden=256):
+        self.hop_size = hop_size
+        self.hidden = hidden
+        self._model = None
+
+    def load_model(self, weights_fpath=None, verbose=True):
+        self._model = nn.ModuleDict({
+            'rnn': nn.GRU(80, self.hidden, batch_first=True),
+            'output': nn.Linear(self.hidden, self.hop_size)
+        }).eval()
+
+    def is_loaded(self):
+        return self._model is not None
+
+    #Waveform of a mel spectrogram (n_mels, frames), the frames are generated one after the other
+    def infer_waveform(self, mel, normalize=True, batched=True, target=8000, overlap=800):
+        with torch.no_grad():
+            frames = torch.from_numpy(np.ascontiguousarray(mel.T))[None].float()
+            h = None
+            wav = []
+            for i in range(frames.size(1)):
+                output, h = self._model['rnn'](frames[:, i:i + 1], h)
+                wav.append(torch.tanh(self._model['output'](output[0, 0])))
+        wav = torch.cat(wav).numpy() if wav else np.zeros(0, dtype=np.float32)
+        #like WaveRNN, the last 20 hops are faded out so the signal does not cut out suddenly
+        fade = min(len(wav), 20 * self.hop_size)
+        wav[len(wav) - fade:] *= np.linspace(1, 0, fade, dtype=np.float32)
+        return wav
+
+#Speaker encoder with the module interface of encoder.inference: a 3 layer LSTM over
+#40 log mel like channels, averaged over overlapping partial utterances. The audio
+#frontend and the partial utterances are the ones of the numpy ProjectionEncoder.
+class StubEncoder(ProjectionEncoder):
+    def __init__(self, hidden=256, embedSize=256):
+        ProjectionEncoder.__init__(self, hidden, embedSize)
+        self._model = nn.ModuleDict({
+            'lstm': nn.LSTM(40, hidden, num_layers=3, batch_first=True),
+            'linear': nn.Linear(hidden, embedSize)
+        }).eval()
+
+    #L2 normalized embeds of a batch of partial utterances (partials, frames, channels)
+    def embed_frames_batch(self, frames_batch):
+        with torch.no_grad():
+            outputs, (hidden, cell) = self._model['lstm'](torch.from_numpy(np.ascontiguousarray(frames_batch)))
+            embeds = F.relu(self._model['linear'](hidden[-1]))
+            embeds = embeds / (embeds.norm(dim=1, keepdim=True) + 1e-5)
+        return embeds.numpy()
@@ -0,0 +1,84 @@
+from backends import Backend
+from pathlib import Path
+import numpy as np
+import serviceConfig
+import vocoding
+import metrics
+
+#Frames WaveRNN fades out at the end of every waveform it generates
+wavernnFadeFrames = 20
+
+#SV2TTS backend: Tacotron synthesizer + WaveRNN vocoder.
+#The synthesizer and the vocoder choose their device themselves.
+class SV2TTSBackend(Backend):
+    name = "sv2tts"
+
+    def __init__(self, device):
+        Backend.__init__(self, device)
+        self.synthesizer = None
+        self.vocoder = None
+
+    @property
+    def sampleRate(self):
+        if self.synthesizer is None:
+            from synthesizer.inference import Synthesizer
+            return Synthesizer.sample_rate
+        return self.synthesizer.sample_rate
+
+    def components(self):
+        return [
+            ("synthesizer", self.loadSynthesizer),
+            ("vocoder", self.loadVocoder)
+        ]
+
+    def isLoaded(self):
+        return self.synthesizer is not None and self.vocoder is not None
+
+    def unloadModels(self):
+        self.synthesizer = None
+        #the vocoder keeps its model in a module global
+        self.vocoder._model = None
+        self.vocoder = None
+
+    def loadSynthesizer(self):
+        from synthesizer.inference import Synthesizer
+        syn_dir = Path("synthesizer/saved_models/logs-pretrained/taco_pretrained")
+        self.synthesizer = Synthesizer(syn_dir)
+
+    def loadVocoder(self):
+        from vocoder import inference as vocoder
+        vocoder_weights = Path("vocoder/saved_models/pretrained/pretrained.pt")
+        vocoder.load_model(vocoder_weights)
+        self.vocoder = vocoder
+
+    #Vocodes the mel spectrograms one after the other, WaveRNN batches the segments of each one
+    def vocodeWindows(self, specs):
+        return [self.vocoder.infer_waveform(spec, target=serviceConfig.wavernnTarget,
+                                            overlap=serviceConfig.wavernnOverlap) for spec in specs]
+
+    #Synthesizer and vocoder stages
+    def stages(self):
+        return [
+            ("acoustic", self.acoustic, None),
+            ("vocoder", self.vocode, None)
+        ]
+
+    #Mel spectrograms of a batch of (text, embed) requests with one synthesizer pass
+    def acoustic(self, requests):
+        texts = [text for text, embed in requests]
+        embeds = [embed for text, embed in requests]
+
+        #synthesize the texts together with the embeds, the synthesizer trims each spectrogram
+        with metrics.stage("acoustic", backend=self.name):
+            return self.synthesizer.synthesize_spectrograms(texts, embeds)
+
+    #Generate the audio using the vocoder, window by window for the long spectrograms
+    def vocode(self, specs):
+        with metrics.stage("vocoder", backend=self.name):
+            return vocoding.vocode(specs, self.vocodeWindows, self.synthesizer.hparams.hop_size,
+                                   serviceConfig.vocoderChunkFrames, serviceConfig.vocoderOverlapFrames,
+                                   serviceConfig.vocoderMaxFrames, wavernnFadeFrames)
+
+    #A second of silence closes every synthesized text
+    def finish(self, wav):
+        return np.pad(wav, (0, self.sampleRate), mode="constant")
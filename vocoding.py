@@ -0,0 +1,61 @@
+import numpy as np
+
+#Chunked vocoding: long mel spectrograms are cut into overlapping windows, vocoded a few
+#windows at a time and joined back with linear crossfades over the overlaps, so the memory
+#of a vocoder pass depends on the window size instead of the length of the output.
+
+#(start, end) frames of the windows of 'chunkFrames' frames, overlapping by 'overlapFrames', covering 'nFrames'
+def windows(nFrames, chunkFrames, overlapFrames):
+    if nFrames <= chunkFrames:
+        return [(0, nFrames)]
+    #the overlaps of a window must not meet in its middle
+    overlapFrames = min(overlapFrames, chunkFrames // 2)
+    step = chunkFrames - overlapFrames
+    return [(start, min(start + chunkFrames, nFrames)) for start in range(0, nFrames - overlapFrames, step)]
+
+#Adds the audio 'pieces' starting at the sample offsets 'starts' into 'length' samples, fading
+#each piece in over its overlap with the previous one and out over its overlap with the next one
+def overlapAdd(pieces, starts, length):
+    out = np.zeros(length, dtype=np.float32)
+    for k, (piece, start) in enumerate(zip(pieces, starts)):
+        piece = np.array(piece[:length - start], dtype=np.float32)
+        if k > 0:
+            n = min(starts[k - 1] + len(pieces[k - 1]) - start, len(piece))
+            if n > 0:
+                piece[:n] *= np.linspace(0.0, 1.0, n, dtype=np.float32)
+        if k + 1 < len(pieces):
+            n = min(start + len(piece) - starts[k + 1], len(piece))
+            if n > 0:
+                piece[len(piece) - n:] *= np.linspace(1.0, 0.0, n, dtype=np.float32)
+        out[start:start + len(piece)] += piece
+    return out
+
+#Vocodes the mel spectrograms 'mels' (n_mels, frames), returning one waveform per spectrogram.
+#'vocodeWindows' vocodes a list of spectrograms in one pass and returns their waveforms, each of
+#'hopLength' samples per frame. With 'chunkFrames' 0 the spectrograms are vocoded whole in one pass,
+#otherwise in windows, at most 'maxFrames' frames (padding included) per pass.
+#Vocoders fading out the end of every output (WaveRNN) give their 'tailFrames' faded frames:
+#the windows are vocoded with that many more frames, whose audio is dropped, so only the
+#real end of a spectrogram is faded out.
+def vocode(mels, vocodeWindows, hopLength, chunkFrames, overlapFrames, maxFrames, tailFrames=0):
+    if chunkFrames <= 0:
+        return vocodeWindows(mels)
+
+    pieces = []
+    for i, mel in enumerate(mels):
+        for start, end in windows(mel.shape[1], chunkFrames, overlapFrames):
+            pieces.append((i, start, end, mel[:, start:min(end + tailFrames, mel.shape[1])]))
+
+    wavs = []
+    perPass = max(1, maxFrames // (chunkFrames + tailFrames))
+    for first in range(0, len(pieces), perPass):
+        batch = pieces[first:first + perPass]
+        outputs = vocodeWindows([window for i, start, end, window in batch])
+        wavs += [wav[:(end - start) * hopLength] for (i, start, end, window), wav in zip(batch, outputs)]
+
+    results = []
+    for i, mel in enumerate(mels):
+        parts = [(start, wav) for (j, start, end, window), wav in zip(pieces, wavs) if j == i]
+        results.append(overlapAdd([wav for start, wav in parts], [start * hopLength for start, wav in parts],
+                                  mel.shape[1] * hopLength))
+    return results
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+import numpy as np
+import threading
+import fcntl
+import json
+import time
+import uuid
+import os
+
+#Enrolled voices: their speaker embeds are the rows of one memory-mapped .npy matrix,
+#described by a small JSON index (id -> row, name, creation time). The rows stay
+#contiguous, a removed voice is replaced by the last one. The files are shared by the
+#processes of the service: writes take a file lock, and every access reloads the
+#index when another process changed it.
+class VoiceRegistry:
+    def __init__(self, directory, initialCapacity=64):
+        self.directory = directory
+        self.initialCapacity = initialCapacity
+        self.indexPath = os.path.join(directory, "index.json")
+        self.matrixPath = os.path.join(directory, "embeds.npy")
+        self.lockPath = os.path.join(directory, ".lock")
+        self.lock = threading.Lock()
+        self.voices = {}
+        self.ids = []
+        self.matrix = None
+        self.norms = None
+        self.version = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    #Reloads the index and the matrix if they changed since they were read, called with the lock held
+    def refresh(self):
+        try:
+            stat = os.stat(self.indexPath)
+        except FileNotFoundError:
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self.version:
+            return
+
+        with open(self.indexPath) as f:
+            index = json.load(f)
+        self.voices = index['voices']
+        self.ids = [None] * len(self.voices)
+        for voiceId, voice in self.voices.items():
+            self.ids[voice['row']] = voiceId
+        if self.matrix is None or self.matrix.shape[0] != index['capacity']:
+            self.matrix = np.load(self.matrixPath, mmap_mode="r+")
+        self.norms = None
+        self.version = version
+
+    #Writes the index, first to a temporary file so a crash never leaves a partial one
+    def save(self):
+        self.matrix.flush()
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump({'capacity': self.matrix.shape[0], 'voices': self.voices}, f)
+        os.replace(tmpPath, self.indexPath)
+        stat = os.stat(self.indexPath)
+        self.version = (stat.st_mtime_ns, stat.st_size)
+
+    #Changes the registry holding the thread and the file locks, on its latest state
+    @contextmanager
+    def writing(self):
+        with self.lock, open(self.lockPath, "a") as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            self.refresh()
+            try:
+                yield
+            except BaseException:
+                #the state in memory is dropped, the next access reloads the saved one
+                self.version = None
+                raise
+            self.save()
+
+    #Makes room for 'rows' embeds of 'size' values, doubling the matrix when it is full
+    def reserve(self, rows, size):
+        if self.matrix is not None and self.matrix.shape[1] != size:
+            raise ValueError("Embeds of size %d expected, got %d" % (self.matrix.shape[1], size))
+        capacity = self.initialCapacity if self.matrix is None else self.matrix.shape[0]
+        if self.matrix is not None and rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+
+        tmpPath = self.matrixPath + ".tmp"
+        matrix = np.lib.format.open_memmap(tmpPath, mode="w+", dtype=np.float32, shape=(capacity, size))
+        if self.matrix is not None:
+            matrix[:len(self.ids)] = self.matrix[:len(self.ids)]
+        matrix.flush()
+        del matrix
+        os.replace(tmpPath, self.matrixPath)
+        self.matrix = np.load(self.matrixPath, mmap_mode="r+")
+
+    #Stores an embed and returns the id of the new voice
+    def enroll(self, embed, name=None):
+        embed = np.asarray(embed, dtype=np.float32).reshape(-1)
+        with self.writing():
+            row = len(self.ids)
+            self.reserve(row + 1, len(embed))
+            self.matrix[row] = embed
+            voiceId = uuid.uuid4().hex
+            self.voices[voiceId] = {'row': row, 'name': name, 'created': time.time()}
+            self.ids.append(voiceId)
+            self.norms = None
+        return voiceId
+
+    #Removes a voice, returning False when it is unknown
+    def remove(self, voiceId):
+        with self.writing():
+            voice = self.voices.pop(voiceId, None)
+            if voice is None:
+                return False
+            #the last row takes the place of the removed one
+            last = len(self.ids) - 1
+            if voice['row'] != last:
+                movedId = self.ids[last]
+                self.matrix[voice['row']] = self.matrix[last]
+                self.voices[movedId]['row'] = voice['row']
+                self.ids[voice['row']] = movedId
+            self.ids.pop()
+            self.norms = None
+        return True
+
+    #Embed of a voice, or None
+    def get(self, voiceId):
+        with self.lock:
+            self.refresh()
+            voice = self.voices.get(voiceId)
+            if voice is None:
+                return None
+            return np.array(self.matrix[voice['row']])
+
+    def describe(self, voiceId):
+        with self.lock:
+            self.refresh()
+            voice = self.voices.get(voiceId)
+            if voice is None:
+                return None
+            return {'id': voiceId, 'name': voice['name'], 'created': voice['created']}
+
+    def list(self):
+        with self.lock:
+            self.refresh()
+            return [{'id': voiceId, 'name': voice['name'], 'created': voice['created']}
+                    for voiceId, voice in self.voices.items()]
+
+    #Enrolled voice closest to 'embed' by cosine similarity: (id, similarity), (None, 0.0) when there is none
+    def search(self, embed):
+        embed = np.asarray(embed, dtype=np.float32).reshape(-1)
+        with self.lock:
+            self.refresh()
+            if not self.ids or self.matrix.shape[1] != len(embed):
+                return None, 0.0
+            matrix = self.matrix[:len(self.ids)]
+            if self.norms is None:
+                self.norms = np.linalg.norm(matrix, axis=1) + 1e-8
+            similarities = matrix @ embed / (self.norms * (np.linalg.norm(embed) + 1e-8))
+            best = int(np.argmax(similarities))
+            return self.ids[best], float(similarities[best])
+
+    def stats(self):
+        with self.lock:
+            self.refresh()
+            return {
+                'voices': len(self.ids),
+                'capacity': 0 if self.matrix is None else self.matrix.shape[0],
+                'size': 0 if self.matrix is None else self.matrix.shape[1]
+            }
@@ -0,0 +1,46 @@
+import torch.nn.functional as F
+import torch
+
+#Inverse of the weight of an invertible 1x1 convolution, computed once in float
+def convinvInverse(conv, dtype):
+    if not hasattr(conv, 'W_inverse') or conv.W_inverse.dtype != dtype:
+        W = conv.conv.weight.squeeze()
+        conv.W_inverse = W.float().inverse()[..., None].to(dtype)
+    return conv.W_inverse
+
+#WaveGlow inference on any device.
+#Same computation as WaveGlow.infer, which allocates its noise with torch.cuda types;
+#'noise' returns the standard normal noise of a shape, on the device of the model.
+def infer(waveglow, spect, sigma=1.0, noise=None):
+    if noise is None:
+        noise = lambda *shape: torch.randn(*shape, device=spect.device)
+
+    spect = waveglow.upsample(spect)
+    # trim conv artifacts. maybe pad spec to kernel multiple
+    time_cutoff = waveglow.upsample.kernel_size[0] - waveglow.upsample.stride[0]
+    spect = spect[:, :, :-time_cutoff]
+
+    spect = spect.unfold(2, waveglow.n_group, waveglow.n_group).permute(0, 2, 1, 3)
+    spect = spect.contiguous().view(spect.size(0), spect.size(1), -1).permute(0, 2, 1)
+
+    audio = sigma * noise(spect.size(0), waveglow.n_remaining_channels, spect.size(2)).to(spect.dtype)
+
+    for k in reversed(range(waveglow.n_flows)):
+        n_half = int(audio.size(1) / 2)
+        audio_0 = audio[:, :n_half, :]
+        audio_1 = audio[:, n_half:, :]
+
+        output = waveglow.WN[k]((audio_0, spect))
+
+        s = output[:, n_half:, :]
+        b = output[:, :n_half, :]
+        audio_1 = (audio_1 - b) / torch.exp(s)
+        audio = torch.cat([audio_0, audio_1], 1)
+
+        audio = F.conv1d(audio, convinvInverse(waveglow.convinv[k], audio.dtype), bias=None, stride=1, padding=0)
+
+        if k % waveglow.n_early_every == 0 and k > 0:
+            z = noise(spect.size(0), waveglow.n_early_size, spect.size(2)).to(spect.dtype)
+            audio = torch.cat((sigma * z, audio), 1)
+
+    return audio.permute(0, 2, 1).contiguous().view(audio.size(0), -1).data